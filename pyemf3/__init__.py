@@ -1,3 +1,6 @@
-from .emf import EMF
+from .emf import EMF, EMFParser, iter_records, probe
+from .index import RecordIndex, build_index
+from .parallel import load_many
+from .writer import EMFStreamWriter
 from .const import *
 from .dc import RGB
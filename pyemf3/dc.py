@@ -174,6 +174,8 @@ class DC:
             # print "Adding handle %s (%s)" % (handle,emr.__class__.__name__.lstrip('_'))
             if handle>=count:
                 self.objects+=[None]*(handle-count+1)
+            elif handle in self.objectholes:
+                self.objectholes.remove(handle)
             self.objects[handle]=emr
         elif self.objectholes:
             handle=self.objectholes.pop()
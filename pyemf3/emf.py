@@ -1,8 +1,16 @@
+import os
+import sys
+import mmap
 import struct
-from io import BytesIO
+from collections import deque
 
 from . import emr
+from . import emz
+from .records import LazyRecordList, SpilledRecordList, ColumnarRecordList
+from .index import RecordIndex, build_index, load_index, _fileStamp
+from .parallel import decodeParallel, packParallel, canFork
 from .dc import DC, RGB
+from .field import _isNumpyArray
 from . import const
 
 def _normalizeColor(c):
@@ -21,6 +29,252 @@ pass it through L{RGB} to generate the color value.
         return RGB(*c)
     raise TypeError("Color must be specified as packed integer or 3-tuple (r,g,b)")
 
+def _readRecords(fh,compact=False,decode=None):
+    """Generator that reads and decodes one record at a time from a
+    file object, until the end of the file.  decode is the set of
+    record types to decode, as returned by L{emr.decodeTypes}."""
+    while True:
+        data=fh.read(8)
+        if len(data)==0:
+            return
+        (iType,nSize)=struct.unpack("<ii",data)
+        e=emr.create(iType,decode)
+        e.unserialize(fh,data,iType,nSize,compact)
+        yield e
+
+def _trackHandle(dc,e):
+    """Update the DC handle table for a record read from a file."""
+    if e.hasHandle():
+        dc.addObject(e,e.handle)
+    elif isinstance(e,emr.DELETEOBJECT):
+        dc.removeObject(e.handle)
+
+def iter_records(source,dc=None,compact=False,decode=None):
+    """
+Read the records of an EMF file one at a time, without building a
+list of all of them.  Each record is decoded and yielded in file
+order, so memory use doesn't depend on the size of the file.
+
+A running handle table is kept in a L{DC}, exactly as L{EMF.load}
+does, so a handle used by a SELECTOBJECT record can be looked up in
+C{dc.objects}.  Pass in a DC to be able to inspect it while iterating.
+
+@param source: filename or binary file object to read from, which may
+be gzip compressed (EMZ)
+@type source: string or file
+@param dc: device context to keep the handle table in
+@type dc: L{DC}
+@param compact: store variable length fields as arrays, see L{EMF.load}
+@type compact: Boolean
+@param decode: record types to decode, see L{EMF.load}
+@type decode: set of int
+@return: generator of EMR records
+    """
+    decode=emr.decodeTypes(decode)
+    if dc is None:
+        dc=DC(6.0,4.0,300)
+    if isinstance(source,(str,bytes,os.PathLike)):
+        fh=open(source,'rb')
+    else:
+        fh=source
+    try:
+        for e in _readRecords(emz.openInput(fh),compact,decode):
+            _trackHandle(dc,e)
+            yield e
+    finally:
+        if fh is not source:
+            fh.close()
+
+def _joinChunks(packed,chunksize):
+    """Generator that joins consecutive small packed records into
+    chunks of about chunksize bytes.  Records larger than that are
+    returned on their own."""
+    pending=[]
+    size=0
+    for data in packed:
+        if len(data)>=chunksize:
+            if pending:
+                yield b''.join(pending)
+                pending=[]
+                size=0
+            yield data
+            continue
+        pending.append(data)
+        size+=len(data)
+        if size>=chunksize:
+            yield b''.join(pending)
+            pending=[]
+            size=0
+    if pending:
+        yield b''.join(pending)
+
+class EMFParser:
+    """
+Incremental push parser for EMF data that arrives in pieces, e.g. from
+a socket.  Feed it chunks of any size with L{feed}, and each record is
+decoded as soon as all of its bytes have arrived.  A handle table is
+kept in a L{DC} as in L{iter_records}.
+
+Gzip compressed (EMZ) data is recognized from its first bytes and
+decompressed incrementally as it is fed in.
+
+Completed records are passed to the callback if one is given.
+Otherwise they are queued, and can be taken by iterating over the
+parser, either with C{for}, which stops when the queue is empty, or
+with C{async for}, which waits for more records until L{close} is
+called::
+
+    parser=EMFParser()
+    while True:
+        chunk=await reader.read(65536)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    parser.close()
+
+    async for e in parser:
+        ...
+    """
+
+    def __init__(self,callback=None,dc=None,compact=False,decode=None):
+        """
+@param callback: function called with each completed record
+@type callback: callable
+@param dc: device context to keep the handle table in
+@type dc: L{DC}
+@param compact: store variable length fields as arrays, see L{EMF.load}
+@type compact: Boolean
+@param decode: record types to decode, see L{EMF.load}
+@type decode: set of int
+        """
+        self.callback=callback
+        if dc is None:
+            dc=DC(6.0,4.0,300)
+        self.dc=dc
+        self.compact=compact
+        self.decode=emr.decodeTypes(decode)
+
+        # bytes received that don't make up a complete record yet
+        self.buf=bytearray()
+        # the first bytes, until there are enough to tell whether the
+        # data is compressed
+        self.start=b''
+        self.decompressor=None
+        self.started=False
+        self.pending=deque()
+        self.closed=False
+        self.event=None
+
+    def feed(self,data):
+        """Add a chunk of data, decoding any records it completes.
+        Returns the number of records completed."""
+        if self.closed:
+            raise ValueError("feed() called after close()")
+        if not self.started:
+            data=self.start+bytes(data)
+            if len(data)<2:
+                self.start=data
+                return 0
+            self.start=b''
+            self.started=True
+            if emz.isCompressed(data):
+                self.decompressor=emz.Decompressor()
+        if self.decompressor is not None:
+            data=self.decompressor.decompress(data)
+        buf=self.buf
+        buf+=data
+        end=len(buf)
+        ptr=0
+        count=0
+        while ptr+8<=end:
+            (iType,nSize)=struct.unpack_from("<ii",buf,ptr)
+            size=max(nSize,8)
+            if ptr+size>end:
+                break
+            # copy, as the buffer gets reused for the following data
+            self._emit(emr.fromBuffer(bytes(buf[ptr:ptr+size]),0,self.compact,self.decode))
+            ptr+=size
+            count+=1
+        del buf[:ptr]
+        return count
+
+    def close(self):
+        """Signal the end of the data.  A final record that was cut
+        short is decoded from the bytes that did arrive, as L{EMF.load}
+        does for a truncated file."""
+        if self.closed:
+            return
+        self.buf+=self.start
+        if len(self.buf)>=8:
+            self._emit(emr.fromBuffer(bytes(self.buf),0,self.compact,self.decode))
+        elif self.buf:
+            raise ValueError("Truncated record at end of EMF data")
+        self.buf=bytearray()
+        self.closed=True
+        self._wake()
+
+    def _emit(self,e):
+        _trackHandle(self.dc,e)
+        if self.callback is not None:
+            self.callback(e)
+        else:
+            self.pending.append(e)
+            self._wake()
+
+    def _wake(self):
+        if self.event is not None:
+            self.event.set()
+
+    def __iter__(self):
+        while self.pending:
+            yield self.pending.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.pending:
+            if self.closed:
+                raise StopAsyncIteration
+            if self.event is None:
+                import asyncio
+                self.event=asyncio.Event()
+            self.event.clear()
+            await self.event.wait()
+        return self.pending.popleft()
+
+def probe(source):
+    """
+Read only the header record of an EMF file, without looking at the
+rest of the file.  The header has the bounds (C{rclBounds}) and frame
+(C{rclFrame}) of the image, the size of the file (C{nBytes}), the
+number of records and handles (C{nRecords} and C{nHandles}), the
+reference device size (C{szlDevice}) and the C{description}.  For an
+EMZ file, only the start of the file is decompressed.
+
+@param source: filename or binary file object to read from
+@type source: string or file
+@return: the header record
+@rtype: L{HEADER<emr.HEADER>}
+@raise ValueError: if the file doesn't start with an EMF header
+    """
+    if isinstance(source,(str,bytes,os.PathLike)):
+        fh=open(source,'rb')
+    else:
+        fh=source
+    try:
+        stream=emz.openInput(fh)
+        data=stream.read(8)
+        if len(data)==8:
+            (iType,nSize)=struct.unpack("<ii",data)
+            if iType==emr.HEADER.emr_id and nSize>8:
+                data+=stream.read(nSize-8)
+                return emr.fromBuffer(data)
+        raise ValueError("Not an EMF file")
+    finally:
+        if fh is not source:
+            fh.close()
+
 class EMF:
     """
 Reference page of the public API for enhanced metafile creation.  See
@@ -39,7 +293,8 @@ L{pyemf} for an overview / mini tutorial.
 """
 
     def __init__(self,width=6.0,height=4.0,density=300,units="in",
-                 description="pyemf.sf.net",verbose=False):
+                 description="pyemf.sf.net",verbose=False,memory_limit=None,
+                 columnar=False):
         """
 Create an EMF structure in memory.  The size of the resulting image is
 specified in either inches or millimeters depending on the value of
@@ -63,11 +318,33 @@ integer coordinates.
 @type units: string
 @param description: optional string to specify a description of the image
 @type description: string
+@param memory_limit: if given, the records are kept in a
+L{SpilledRecordList<records.SpilledRecordList>}, which writes records
+out to a temporary file once the records in memory would pack to more
+than this many bytes.  Spilled records are read back when they are
+accessed, and are copied straight from the temporary file when saving.
+Records loaded lazily are read from the memory mapped file instead.
+@type memory_limit: int
+@param columnar: keep the records in a
+L{ColumnarRecordList<records.ColumnarRecordList>}, which stores the
+fields of the records of each type in arrays, and returns views of
+them.  Records loaded lazily aren't stored this way.
+@type columnar: Boolean
 
 """
         self.filename=None
         self.dc=DC(width,height,density,units)
-        self.records=[]
+        if memory_limit is not None and columnar:
+            raise ValueError("memory_limit and columnar can't be used together")
+        self.memory_limit=memory_limit
+        self.columnar=columnar
+        self.records=self._newRecordList()
+
+        # (filename,stamp,packed records) of the last save,
+        # so that saving again can write just the new records
+        self.lastsave=None
+        # index of the EOF record of a loaded file
+        self.endindex=None
 
         # path recordkeeping
         self.pathstart=0
@@ -88,27 +365,81 @@ integer coordinates.
                 int(self.dc.height/100.0*self.dc.ref_pixelheight/self.dc.ref_height))
 
 
-    def loadmem(self,membuf=None):
+    def loadmem(self,membuf=None,compact=False,decode=None):
         """
 Read an existing buffer from a string of bytes.  If any records exist
 in the current object, they will be overwritten by the records from
 this buffer.
 
+The buffer is not copied: any object supporting the buffer protocol
+(bytes, bytearray, memoryview, mmap) is decoded in place, and the
+records keep views of it.  A gzip compressed (EMZ) buffer is
+decompressed first.
+
 @param membuf: buffer to load
-@type membuf: string
+@type membuf: bytes-like object
+@param compact: store point lists and other variable length fields as arrays, see L{load}
+@type compact: Boolean
+@param decode: record types to decode, see L{load}
+@type decode: set of int
 @returns: True for success, False for failure.
 @rtype: Boolean
         """
-        fh = BytesIO(membuf)
-        self._load(fh)
+        if emz.isCompressed(membuf):
+            membuf=emz.decompress(membuf)
+        self.records=self._newRecordList(compact)
+        self._unserializeBuffer(membuf,compact,emr.decodeTypes(decode))
+        self.scaleheader=False
+        self._markEnd()
+        self.dc.getBounds(self.records[0])
 
-    def load(self,filename=None):
+    def load(self,filename=None,lazy=False,compact=False,decode=None,workers=None):
         """
 Read an existing EMF file.  If any records exist in the current
 object, they will be overwritten by the records from this file.
 
+If lazy is True, the file is memory mapped and only the position,
+type and size of each record is read up front.  Each record is decoded
+the first time it is accessed through L{records}, so opening a large
+file and looking at a few records doesn't require parsing all of it.
+If the file has an up to date sidecar index (see L{build_index}), the
+record positions are read from it instead of scanning the file.
+
+If compact is True, variable length fields (the aptl points of
+polylines and polygons, aPolyCounts, and the dx spacing of text) are
+decoded in bulk into arrays instead of lists of lists.  Points are
+stored as a L{PointArray<field.PointArray>} whose items are (x,y)
+tuples, which takes a fraction of the memory for large point lists.
+
+If decode is a set of record types (e.g. C{{EXTTEXTOUTW.emr_id}}),
+only records of those types are parsed.  Every other record, including
+types that pyemf doesn't know about, is kept as an opaque
+L{RAW<emr.RAW>} record holding its original bytes, which is written
+back out unchanged by L{save}.  The header, EOF and the records that
+create or delete handles are always decoded.
+
+Gzip compressed EMF (EMZ) files are recognized from their contents
+and decompressed as they are read.  They can't be memory mapped, so a
+lazy load of an EMZ decompresses it into memory, and workers is
+ignored.
+
+If workers is greater than 1, the records are decoded in that many
+worker processes, each handling contiguous runs of records from its
+own memory map of the file.  The handle table is then rebuilt serially
+in file order.  This only pays off for large files, as the decoded
+records have to be pickled back to this process.  workers is ignored
+for lazy loads.
+
 @param filename: filename to load
 @type filename: string
+@param lazy: decode records on first access instead of at load time
+@type lazy: Boolean
+@param compact: store variable length fields as arrays
+@type compact: Boolean
+@param decode: record types to decode, or None to decode all records
+@type decode: set of int
+@param workers: number of processes used to decode the file
+@type workers: int
 @returns: True for success, False for failure.
 @rtype: Boolean
         """
@@ -117,46 +448,187 @@ object, they will be overwritten by the records from this file.
 
         if self.filename:
             fh=open(self.filename,'rb')
-            self._load(fh)
+            decode=emr.decodeTypes(decode)
+            stream=emz.openInput(fh)
+            if stream is not fh:
+                if lazy:
+                    self._loadLazyBuffer(stream.read(),compact,decode)
+                else:
+                    self._load(stream,compact,decode)
+                fh.close()
+            elif lazy:
+                self._loadLazy(fh,compact,decode)
+            elif workers is not None and workers>1:
+                self._loadParallel(fh,workers,compact,decode)
+            else:
+                self._load(fh,compact,decode)
+
+    def close(self):
+        """
+Release the file the records are read from: the memory map of a lazy
+load, or the temporary file records are spilled to when there is a
+memory_limit.  Records that have already been read stay usable, but
+the others can't be read any more, so the EMF can't be saved after
+this.  A file that is memory mapped can't be replaced or deleted on
+Windows, so close a lazily loaded EMF when done with it, or use it in
+a C{with} block::
+
+    with EMF() as emf:
+        emf.load("map.emf",lazy=True)
+        print(emf.records[10])
+        """
+        if hasattr(self.records,'close'):
+            self.records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exctype,exc,tb):
+        self.close()
+
+    @staticmethod
+    def open_append(filename,verbose=False):
+        """
+Open an existing EMF file to draw more records at the end of it.  Only
+the header and the EOF record are read; the records drawn are written
+straight to the file, and L{close<writer.EMFStreamWriter.close>} writes
+the EOF again and updates the size, number of records, number of
+handles and bounds in the header.  The file is never rewritten::
+
+    with EMF.open_append("log.emf") as emf:
+        emf.LineTo(x,y)
+
+@param filename: uncompressed EMF file to add to
+@type filename: string
+@return: writer appending to the file
+@rtype: L{EMFStreamWriter<writer.EMFStreamWriter>}
+        """
+        from .writer import EMFStreamWriter
+        return EMFStreamWriter(filename,verbose=verbose,append=True)
 
-    def _load(self,fh):
-        self.records=[]
-        self._unserialize(fh)
+    def build_index(self,filename=None,sidecar=False):
+        """
+Build a L{RecordIndex<index.RecordIndex>} of the offset, type and size
+of every record in an EMF file, reading only the 8 byte prefix of each
+record.  Records can then be decoded one at a time with
+C{get_record(i)} or C{records_of_type(t)} without loading the file.
+The index keeps the file open for this until its C{close()} method is
+called, or the C{with} block it is used in ends.
+
+If sidecar is True, the index is also written to C{filename.idx} so
+that later calls, and lazy or parallel loads (see L{load}), of the
+same file can skip the scan.  An ordinary load reads every record
+anyway, so it doesn't use the sidecar.  The sidecar is ignored once
+the size or modification time of the file changes.
+
+@param filename: file to index, defaults to the file this object was
+loaded from
+@type filename: string
+@param sidecar: write a sidecar index file
+@type sidecar: Boolean
+@return: the index of the file
+@rtype: L{RecordIndex<index.RecordIndex>}
+        """
+        if filename is None:
+            filename=self.filename
+        return build_index(filename,sidecar)
+
+    def _newRecordList(self,compact=False):
+        """Return an empty list to hold the records."""
+        if self.memory_limit is not None:
+            return SpilledRecordList(self.memory_limit,compact)
+        if self.columnar:
+            return ColumnarRecordList(compact)
+        return []
+
+    def _load(self,fh,compact=False,decode=None):
+        self.records=self._newRecordList(compact)
+        self._unserialize(fh,compact,decode)
         self.scaleheader=False
+        self._markEnd()
         # get DC from header record
         self.dc.getBounds(self.records[0])
 
+    def _loadParallel(self,fh,workers,compact=False,decode=None):
+        index=load_index(fh.name)
+        if index is None:
+            try:
+                buf=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                self._load(fh,compact,decode)
+                return
+            index=RecordIndex()
+            index.scanBuffer(buf)
+            buf.close()
+        filesize=os.fstat(fh.fileno()).st_size
+        fh.close()
+
+        self.records=decodeParallel(self.filename,index,filesize,workers,compact,decode,
+                                    self._newRecordList(compact))
+        for e in self.records:
+            _trackHandle(self.dc,e)
+        self.scaleheader=False
+        self._markEnd()
+        self.dc.getBounds(self.records[0])
+
+    def _loadLazy(self,fh,compact=False,decode=None):
+        try:
+            buf=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            self._load(fh,compact,decode)
+            return
+        index=load_index(fh.name)
+        fh.close()
+        if index is not None and index.offsets and index.offsets[-1]+max(index.sizes[-1],8)>len(buf):
+            index=None
+        self._loadLazyBuffer(buf,compact,decode,index,fh.name)
+
+    def _loadLazyBuffer(self,buf,compact=False,decode=None,index=None,filename=None):
+        self.records=LazyRecordList(buf,compact,decode,index,filename)
+
+        # the handle table has to be rebuilt up front, so only the
+        # records that take part in it are decoded now.
+        handletypes=emr.handleTypes()
+        for i in range(len(self.records)):
+            if self.records.types[i] in handletypes:
+                _trackHandle(self.dc,self.records[i])
+        self.scaleheader=False
+        self._markEnd()
+        self.dc.getBounds(self.records[0])
 
-    def _unserialize(self,fh):
+
+    def _unserialize(self,fh,compact=False,decode=None):
         try:
-            count=1
-            while count>0:
-                data=fh.read(8)
-                count=len(data)
-                if count>0:
-                    (iType,nSize)=struct.unpack("<ii",data)
-                    if self.verbose: print("EMF:  iType=%d nSize=%d" % (iType,nSize))
-
-                    if iType in emr.emrmap:
-                        e=emr.emrmap[iType]()
-                    else:
-                        e=emr.EMR_UNKNOWN()
-
-                    e.unserialize(fh,data,iType,nSize)
-                    self.records.append(e)
-
-                    if e.hasHandle():
-                        self.dc.addObject(e,e.handle)
-                    elif isinstance(e,emr.DELETEOBJECT):
-                        self.dc.removeObject(e.handle)
-
-                    if self.verbose:
-                        print("Unserializing: ", end=' ')
-                        print(e)
+            for e in _readRecords(fh,compact,decode):
+                if self.verbose: print("EMF:  iType=%d nSize=%d" % (e.iType,e.nSize))
+                self.records.append(e)
+                _trackHandle(self.dc,e)
+
+                if self.verbose:
+                    print("Unserializing: ", end=' ')
+                    print(e)
 
         except EOFError:
             pass
 
+    def _unserializeBuffer(self,buf,compact=False,decode=None):
+        """Decode all the records in a buffer without copying it."""
+        data=memoryview(buf)
+        end=len(data)
+        ptr=0
+        while ptr<end:
+            e=emr.fromBuffer(data,ptr,compact,decode)
+            if self.verbose: print("EMF:  iType=%d nSize=%d" % (e.iType,e.nSize))
+            self.records.append(e)
+            _trackHandle(self.dc,e)
+
+            if self.verbose:
+                print("Unserializing: ", end=' ')
+                print(e)
+            ptr+=max(e.nSize,8)
+
     def _append(self,e):
         """Append an EMR to the record list, unless the record has
         been flagged as having an error."""
@@ -170,65 +642,328 @@ object, they will be overwritten by the records from this file.
 
     def _end(self):
         """
-Append an EOF record and compute header information.  The header needs
-to know the number of records, number of handles, bounds, and size of
-the entire metafile before it can be written out, so we have to march
-through all the records and gather info.
-        """
-
-        end=self.records[-1]
-        if not isinstance(end,emr.EOF):
+Pack all the records followed by an EOF record and compute header
+information.  The header needs to know the number of records, number
+of handles, bounds, and size of the entire metafile before it can be
+written out, so every other record is packed first, and the header is
+packed last using the sizes of the others.  Returns the list of packed
+records, each of which is only packed once, or for records kept in a
+L{SpilledRecordList<records.SpilledRecordList>}, a generator of them.
+        """
+        (skip,eof)=self._endRecords()
+        if isinstance(self.records,SpilledRecordList):
+            # the packed records are streamed, so that spilled records
+            # aren't all read back into memory at once
+            size=self.records.packedSize(1)
+            if eof is not None and skip is None:
+                size+=eof.calcSize()
+            header=self._packHeader(size)
+            return self._iterPacked(header,skip,eof)
+        packed=[None]
+        size=0
+        saved=self._iterEnd(skip,eof)
+        next(saved)
+        for e in saved:
+            # untouched records of a lazily loaded file are already
+            # memoryviews of their bytes
+            if not isinstance(e,memoryview):
+                e=e.pack()
+            packed.append(e)
+            size+=len(e)
+            if self.verbose: print("size=%d total=%d" % (len(e),size))
+        packed[0]=self._packHeader(size)
+        return packed
+
+    def _iterPacked(self,header,skip,eof):
+        yield header
+        saved=self._iterEnd(skip,eof)
+        next(saved)
+        for e in saved:
+            if not isinstance(e,memoryview):
+                e=e.pack()
+            yield e
+
+    def _iterEnd(self,skip,eof):
+        """Iterate over the records to save, leaving out record skip
+        and adding eof after the last one, as returned by
+        L{_endRecords}."""
+        for i,e in enumerate(self._iterSaved()):
+            if i!=skip:
+                yield e
+        if eof is not None:
+            yield eof
+
+    def _endSizes(self):
+        """Like L{_end}, but only work out the size of every record
+        other than the header without packing them.  Returns the
+        records to save and the list of their sizes, with the header
+        already packed in place of the first record."""
+        records=list(self._iterEnd(*self._endRecords()))
+        sizes=[0]
+        for e in records[1:]:
+            if isinstance(e,memoryview):
+                sizes.append(len(e))
+            else:
+                sizes.append(e.calcSize())
+        records[0]=self._packHeader(sum(sizes))
+        sizes[0]=len(records[0])
+        return (records,sizes)
+
+    def _endRecords(self):
+        """Fill in the number of records and handles and the bounds in
+        the header.  The EOF record isn't added to the records, so
+        that saving doesn't change them and more can be drawn after
+        saving.  Returns the index of a record to leave out, which is
+        the EOF of a loaded file when more records have been drawn
+        after it, or None, and the EOF record to write after the last
+        record, or None if the records already end with one."""
+        skip=None
+        eof=None
+        last=len(self.records)-1
+        if (self.endindex is not None and self.endindex<last
+            and isinstance(self.records[self.endindex],emr.EOF)):
+            skip=self.endindex
+            eof=self.records[skip]
+        elif not isinstance(self.records[last],emr.EOF):
             if self.verbose: print("adding EOF record")
-            e=emr.EOF()
-            self._append(e)
+            eof=emr.EOF()
         header=self.records[0]
         header.setBounds(self.dc,self.scaleheader)
-        header.nRecords=len(self.records)
+        header.nRecords=len(self.records)+(eof is not None and skip is None)
         header.nHandles=len(self.dc.objects)
-        size=0
-        for e in self.records:
-            e.resize()
-            size+=e.nSize
-            if self.verbose: print("size=%d total=%d" % (e.nSize,size))
-        if self.verbose: print("total: %s bytes" % size)
-        header.nBytes=size
-
-    def save(self,filename=None):
+        return (skip,eof)
+
+    def _markEnd(self):
+        """Remember the position of the EOF record that ends a loaded
+        file, which is moved to the end when saving if more records
+        are drawn."""
+        self.endindex=None
+        if len(self.records)>1 and isinstance(self.records[-1],emr.EOF):
+            self.endindex=len(self.records)-1
+
+    def _packHeader(self,size):
+        """Pack the header, given the size of all the other records."""
+        header=self.records[0]
+        header.resize()
+        header.nBytes=size+header.nSize
+        if header.isModified():
+            # setting nBytes may have dropped the bytes the header was
+            # loaded from, which could have had a different size
+            header.resize()
+            header.nBytes=size+header.nSize
+        if self.verbose: print("total: %s bytes" % header.nBytes)
+        return header.pack()
+
+    def save(self,filename=None,compress=None,level=9,threads=None,workers=None):
         """
 Write the EMF to disk.
 
+If the file was written by the previous save and hasn't changed since,
+and the records saved then haven't been changed either, only the
+records drawn since then are written over the old EOF record, and the
+header is rewritten in place.
+
+If compress is True, or is None and the filename ends in C{.emz}, the
+file is written as gzip compressed EMF (EMZ).  The data is compressed
+as it is written, and with threads greater than 1 it is compressed in
+blocks of a megabyte in parallel, still producing a standard single
+member gzip file.
+
+If workers is greater than 1, an uncompressed file is written by that
+many worker processes, each packing a different run of records and
+writing it directly to its offset in the file.  The size of every
+record is worked out first so the offsets are known.  The file is the
+same as one written by a single process.  This needs processes to be
+forked, so it isn't available on Windows, where workers is ignored.
+It is also ignored when the EMF was created with a memory_limit.
+The packed bytes of the records aren't kept in this process, so a
+later save packs any modified records again.
+
 @param filename: filename to write
 @type filename: string
+@param compress: write an EMZ file
+@type compress: Boolean
+@param level: zlib compression level for EMZ files
+@type level: int
+@param threads: number of threads compressing an EMZ file
+@type threads: int
+@param workers: number of processes packing an uncompressed file
+@type workers: int
 @returns: True for success, False for failure.
 @rtype: Boolean
         """
 
-        self._end()
-
         if filename:
             self.filename=filename
+        if self.filename and compress is None:
+            compress=emz.isEMZName(self.filename)
+
+        if (self.filename and not compress and workers is not None and workers>1
+            and canFork() and not self._canSaveTail()
+            and not isinstance(self.records,SpilledRecordList)):
+            target=self._saveTarget()
+            (records,sizes)=self._endSizes()
+            if packParallel(target,records[0],records,sizes,workers):
+                if target!=self.filename:
+                    os.replace(target,self.filename)
+                self.lastsave=None
+                return True
+            # a record didn't pack to the size it was expected to
+            # have, so write the file again the usual way
+
+        packed=self._end()
 
         if self.filename:
+            if not compress and self._saveTail(packed):
+                self._saved(packed)
+                return True
+            target=self._saveTarget()
             try:
-                fh=open(self.filename,"wb")
-                self._serialize(fh)
+                fh=open(target,"wb")
+                if compress:
+                    emz.writeCompressed(fh,_joinChunks(packed,1<<20),level,threads)
+                else:
+                    fh.writelines(packed)
                 fh.close()
+                if target!=self.filename:
+                    os.replace(target,self.filename)
+                self.lastsave=None
+                if not compress:
+                    self._saved(packed)
                 return True
             except:
                 raise
                 return False
         return False
 
-    def _serialize(self,fh):
-        for e in self.records:
-            if self.verbose: print(e)
-            e.serialize(fh)
+    def _saveTarget(self):
+        """Return the name to write the file to before it replaces the
+        file being saved."""
+        if self._isMapped(self.filename):
+            # records of a lazy load are still read from the mapped
+            # file, so it can't be overwritten in place
+            return "%s.%d.tmp" % (self.filename,os.getpid())
+        return self.filename
+
+    def _saved(self,packed):
+        """Remember what was written to the file by save."""
+        if not isinstance(self.records,list):
+            # lazily loaded records are repacked from the map anyway
+            self.lastsave=None
+            return
+        self.lastsave=(self.filename,_fileStamp(self.filename),packed)
+
+    def _canSaveTail(self):
+        """Return True if the file being saved is as the last save left
+        it."""
+        if self.lastsave is None or self.lastsave[0]!=self.filename:
+            return False
+        try:
+            return _fileStamp(self.filename)==self.lastsave[1]
+        except OSError:
+            return False
+
+    def _saveTail(self,packed):
+        """Write only the records after those of the last save, if
+        the file and those records are unchanged.  Returns False if
+        the whole file has to be written."""
+        if not self._canSaveTail():
+            return False
+        oldpacked=self.lastsave[2]
+        # number of records before the old EOF
+        n=len(oldpacked)-1
+        if len(packed)<=n or len(packed[0])!=len(oldpacked[0]):
+            return False
+        # unchanged records return the same bytes object they were
+        # packed to last time
+        for i in range(1,n):
+            if packed[i] is not oldpacked[i]:
+                return False
+        offset=sum(map(len,oldpacked[:n]))
+        with open(self.filename,'r+b') as fh:
+            fh.seek(offset)
+            fh.writelines(packed[n:])
+            fh.truncate()
+            fh.seek(0)
+            fh.write(packed[0])
+        return True
+
+    def tobytes(self):
+        """
+Return the complete EMF file as a bytes object, as L{save} would write
+it.
+
+@rtype: bytes
+        """
+        return b''.join(self._end())
+
+    def serialize_into(self,buffer,offset=0):
+        """
+Write the complete EMF file into a preallocated writable buffer, such
+as a bytearray, a writable mmap or the buffer of a shared memory
+block, starting at the given offset.  The size needed is the
+C{nBytes} of the header, which is also the number of bytes written.
+
+@param buffer: buffer to write into
+@type buffer: writable bytes-like object
+@param offset: position in buffer to start at
+@type offset: int
+@return: the number of bytes written
+@rtype: int
+@raise ValueError: if the buffer isn't big enough
+        """
+        packed=self._end()
+        size=self.records[0].nBytes
+        view=memoryview(buffer).cast('B')
+        if offset+size>len(view):
+            raise ValueError("buffer too small for EMF of %d bytes at offset %d" % (size,offset))
+        ptr=offset
+        for data in packed:
+            end=ptr+len(data)
+            view[ptr:end]=data
+            ptr=end
+        return ptr-offset
+
+    def iter_chunks(self,chunksize=65536):
+        """
+Generator that returns the complete EMF file in pieces, for writing
+with C{os.writev}, C{socket.sendmsg} or a streaming HTTP response
+without building one big bytes object.  Consecutive small records are
+joined into chunks of about chunksize bytes, and records larger than
+that are returned on their own.
+
+@param chunksize: target size of each chunk in bytes
+@type chunksize: int
+@return: generator of bytes-like objects
+        """
+        return _joinChunks(self._end(),chunksize)
+
+    def _isMapped(self,filename):
+        """Return True if filename is the file that lazily loaded
+        records are being read from."""
+        source=getattr(self.records,'filename',None)
+        try:
+            return source is not None and os.path.samefile(source,filename)
+        except OSError:
+            return False
+
+    def _iterSaved(self):
+        if isinstance(self.records,(LazyRecordList,SpilledRecordList)):
+            return self.records.iterSaved()
+        return iter(self.records)
 
     def _create(self,width,height,dots_per_unit,units):
         pass
 
     def _getBounds(self,points):
-        """Get the bounding rectangle for this list of 2-tuples."""
+        """Get the bounding rectangle for this list of 2-tuples, or an
+        Nx2 NumPy array of points."""
+        if _isNumpyArray(points):
+            if points.dtype.kind not in "iu":
+                raise TypeError("points must be integers, not a NumPy array of %s" % points.dtype)
+            (left,top)=points.min(axis=0)
+            (right,bottom)=points.max(axis=0)
+            return ((int(left),int(top)),(int(right),int(bottom)))
         left=points[0][0]
         right=left
         top=points[0][1]
@@ -309,14 +1044,20 @@ Write the EMF to disk.
         """polylist is a list of lists of points, where each inner
         list represents a single polygon or line.  The number of
         polygons is the size of the outer list."""
-        points=[]
-        polycounts=[]
-        for polygon in polylist:
-            count=0
-            for point in polygon:
-                points.append(point)
-                count+=1
-            polycounts.append(count)
+        if any(_isNumpyArray(polygon) for polygon in polylist):
+            numpy=sys.modules['numpy']
+            polylist=[numpy.asarray(polygon).reshape(-1,2) for polygon in polylist]
+            points=numpy.concatenate(polylist)
+            polycounts=[len(polygon) for polygon in polylist]
+        else:
+            points=[]
+            polycounts=[]
+            for polygon in polylist:
+                count=0
+                for point in polygon:
+                    points.append(point)
+                    count+=1
+                polycounts.append(count)
 
         bounds=self._getBounds(points)
         if self._useShort(bounds):
@@ -858,7 +1599,7 @@ Set the pixel to the given color.
         """
 
 Draw a sequence of connected lines.
-@param points: list of x,y tuples
+@param points: list of x,y tuples, or an Nx2 integer NumPy array
 @return: true if polyline is successfully rendered.
 @rtype: int
 @type points: tuple
@@ -881,7 +1622,7 @@ described by a list of x,y tuples as in L{Polyline}.  For example::
 draws two lines, one from 100,100 to 200,100, and another from 300,100
 to 400,100.
 
-@param polylines: list of lines, where each line is a list of x,y tuples
+@param polylines: list of lines, where each line is a list of x,y tuples or an Nx2 integer NumPy array
 @type polylines: list
 @return: true if polypolyline is successfully rendered.
 @rtype: int
@@ -901,7 +1642,7 @@ the border is drawn with the current pen, and the interior is filled
 with the current brush.  See L{SetPolyFillMode} for the fill effects
 when an overlapping polygon is defined.
 
-@param points: list of x,y tuples
+@param points: list of x,y tuples, or an Nx2 integer NumPy array
 @return: true if polygon is successfully rendered.
 @rtype: int
 @type points: tuple
@@ -934,7 +1675,7 @@ B{Note:} Currently partially supported in OpenOffice.  The line width
 is ignored and the polygon border is not closed (the final point is
 not connected to the starting point in each polygon).
 
-@param polygons: list of polygons, where each polygon is a list of x,y tuples
+@param polygons: list of polygons, where each polygon is a list of x,y tuples or an Nx2 integer NumPy array
 @type polygons: list
 @return: true if polypolygon is successfully rendered.
 @rtype: int
@@ -1115,7 +1856,7 @@ points each: two control points and an end point, as the ending point
 of the previous curve is used as the starting point for the next
 curve.
 
-@param points: list of x,y tuples that are either end points or control points
+@param points: list of x,y tuples (or an Nx2 integer NumPy array) that are either end points or control points
 @return: true if bezier curve was successfully rendered.
 @rtype: int
 @type points: tuple
@@ -1182,7 +1923,7 @@ the given position.
 Draw a sequence of connected lines starting from the current
 position and update the position to the final point in the list.
 
-@param points: list of x,y tuples
+@param points: list of x,y tuples, or an Nx2 integer NumPy array
 @return: true if polyline is successfully rendered.
 @rtype: int
 @type points: tuple
@@ -1234,7 +1975,7 @@ curve.  If the arc is successfully rendered, the current position is
 updated so that subsequent path operations such as L{LineTo},
 L{PolylineTo}, etc. will follow from the end of the curve.
 
-@param points: list of x,y tuples that are either end points or control points
+@param points: list of x,y tuples (or an Nx2 integer NumPy array) that are either end points or control points
 @return: true if bezier curve was successfully rendered.
 @rtype: int
 @type points: tuple
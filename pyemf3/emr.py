@@ -1,5 +1,6 @@
 import os
 import struct
+from io import BytesIO
 
 from . import const
 from .field import Record, EMFString, List, Tuples, Points
@@ -9,12 +10,63 @@ def register_emr(klass):
     emrmap[klass.emr_id] = klass
     return klass
 
-class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't work
+def create(iType,decode=None):
+    """Return a new EMR object of the class registered for the given
+    record type, or an EMR_UNKNOWN if the type isn't handled.  If
+    decode is a set of record types and iType isn't in it, return a
+    RAW record that keeps the undecoded bytes instead."""
+    if decode is not None and iType not in decode:
+        return RAW(iType)
+    if iType in emrmap:
+        return emrmap[iType]()
+    return EMR_UNKNOWN()
+
+def decodeTypes(types):
+    """Return the set of record types to decode when only the given
+    types are wanted.  The header, EOF and the records that create or
+    delete handles are always included, because the EMF needs them for
+    its own bookkeeping.  None means decode everything."""
+    if types is None:
+        return None
+    return set(types)|handleTypes()|{HEADER.emr_id,EOF.emr_id}
+
+def fromBuffer(data,ptr=0,compact=False,decode=None):
+    """Decode the record that starts at offset ptr of a buffer holding
+    one or more records.  The record keeps a view of the buffer rather
+    than a copy of its bytes, or the buffer itself if it holds just
+    this record.  See L{EMR_UNKNOWN.unserializeData} for compact and
+    L{create} for decode."""
+    (iType,nSize)=struct.unpack_from("<ii",data,ptr)
+    e=create(iType,decode)
+    e.iType=iType
+    e.nSize=nSize
+    if nSize>8:
+        if ptr or len(data)!=nSize:
+            data=memoryview(data)[ptr:ptr+nSize]
+        e.unserializeData(data,compact=compact)
+    return e
+
+def handleTypes():
+    """Return the set of record types that take part in handle
+    bookkeeping: records that create a handle, plus DELETEOBJECT."""
+    types=set()
+    for iType,klass in emrmap.items():
+        if klass.hasHandle is not EMR_UNKNOWN.hasHandle or issubclass(klass,DELETEOBJECT):
+            types.add(iType)
+    return types
+
+class EMR_UNKNOWN(Record):
     """baseclass for EMR objects"""
+    __slots__=('verbose','datasize','error')
+
     emr_id=0
 
     twobytepadding=b'\0'*2
 
+    # attributes outside the typedef that are also part of the bytes of
+    # the record
+    framing=('iType','nSize','unhandleddata')
+
     def __init__(self):
         Record.__init__(self)
         self.nSize=0
@@ -29,6 +81,18 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
         # error code.  Currently just used as a boolean
         self.error=0
 
+    def isModified(self):
+        """Return True if the record has to be packed from its fields
+        when saved, or False if the bytes it was loaded from or last
+        packed into can be written out instead."""
+        return self.data is None or len(self.data)!=self.nSize
+
+    def setModified(self):
+        """Mark the record as modified.  Assigning to a field does this
+        automatically, but changes made in place, like
+        C{e.aptl[0][0]=10}, can't be seen."""
+        self.data=None
+
     def hasHandle(self):
         """Return true if this object has a handle that needs to be
         saved in the object array for later recall by SelectObject."""
@@ -42,14 +106,14 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
 
     def getBounds(self):
         """Return bounds of object, or None if not applicable."""
-        if 'rclBounds' in self.values:
+        if 'rclBounds' in self.format.fmtmap:
             return self.rclBounds
         return None
 
-    def unserialize(self,fh,already_read,itype=-1,nsize=-1):
+    def unserialize(self,fh,already_read,itype=-1,nsize=-1,compact=False):
         """Read data from the file object and, using the format
         structure defined by the subclass, parse the data and store it
-        in self.values[] list."""
+        in the fields of the record."""
         prevlen=len(already_read)
 
         if itype>0:
@@ -58,10 +122,23 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
         else:
             (self.iType,self.nSize)=struct.unpack("<ii",already_read)
         if self.nSize>prevlen:
-            self.data=already_read+fh.read(self.nSize-prevlen)
-            last=self.format.unpack(self.data,self,prevlen)
-            if self.nSize>last:
-                self.unserializeExtra(self.data[last:])
+            data=already_read+fh.read(self.nSize-prevlen)
+            self.unserializeData(data,prevlen,compact)
+
+    def unserializeData(self,data,ptr=8,compact=False):
+        """Parse the record from data already in memory.  data holds
+        the entire record including the iType and nSize prefix, and
+        ptr is the position of the first field.  Any bytes-like object
+        is accepted, and is kept as it is rather than copied, so a
+        memoryview of a larger buffer keeps that buffer alive.  If
+        compact is True, variable length fields like aptl, aPolyCounts
+        and dx are stored as arrays (see L{field.PointArray}) instead
+        of lists of lists."""
+        last=self.format.unpack(data,self,ptr,compact)
+        if self.nSize>last:
+            self.unserializeExtra(data[last:])
+        # kept so the record can be saved without repacking it
+        self.data=data
 
     def unserializeExtra(self,data):
         """Hook for subclasses to handle extra data in the record that
@@ -69,31 +146,48 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
         self.unhandleddata=data
         pass
 
-    def serialize(self,fh):
+    def pack(self):
+        """Return the bytes of the whole record, updating nSize to
+        match.  The bytes are kept, and returned again by later calls
+        until the record is modified.  An unmodified record that was
+        loaded from a file returns its original bytes."""
+        if not self.isModified():
+            return self.data
         try:
             #print "packing!"
-            bytestr=self.format.pack(self.values,self,8)
+            bytestr=self.format.pack(self,8)
             #fh.write(struct.pack(self.format.fmt,*self.values))
         except struct.error:
             print("!!!!!Struct error:", end=' ')
             print(self)
             raise
         before=self.nSize
-        self.nSize=8+len(bytestr)+self.sizeExtra()
+        extrasize=self.sizeExtra()
+        self.nSize=8+len(bytestr)+extrasize
         if self.verbose and before!=self.nSize:
             print("resize: before=%d after=%d" % (before,self.nSize), end=' ')
             print(self)
         if self.nSize%4 != 0:
-            print("size error--must be divisible by 4. before=%d after=%d calcNumBytes=%d extra=%d" % (before,self.nSize,len(bytestr),self.sizeExtra()))
+            print("size error--must be divisible by 4. before=%d after=%d calcNumBytes=%d extra=%d" % (before,self.nSize,len(bytestr),extrasize))
             for name in self.format.names:
                 fmt=self.format.fmtmap[name]
                 size=fmt.calcNumBytes(self,name)
                 print("  name=%s size=%s" % (name,size))
             print(self)
             raise TypeError
-        fh.write(struct.pack("<ii",self.iType,self.nSize))
-        fh.write(bytestr)
-        self.serializeExtra(fh)
+        header=struct.pack("<ii",self.iType,self.nSize)
+        if extrasize:
+            fh=BytesIO()
+            self.serializeExtra(fh)
+            data=header+bytestr+fh.getvalue()
+        else:
+            data=header+bytestr
+        # cache the bytes for the next save
+        self.data=data
+        return data
+
+    def serialize(self,fh):
+        fh.write(self.pack())
 
     def serializeExtra(self,fh):
         """This is for special cases, like writing text or lists.  If
@@ -103,6 +197,8 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
             fh.write(self.unhandleddata)
 
     def resize(self):
+        if not self.isModified():
+            return
         before=self.nSize
         self.nSize=8+self.format.calcNumBytes(self)+self.sizeExtra()
         if self.verbose and before!=self.nSize:
@@ -117,6 +213,13 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
             print(self)
             raise TypeError
 
+    def calcSize(self):
+        """Return the number of bytes that L{pack} will return, without
+        packing the record or changing nSize."""
+        if not self.isModified():
+            return len(self.data)
+        return 8+self.format.calcNumBytes(self)+self.sizeExtra()
+
     def sizeExtra(self):
         """Hook for subclasses before anything is serialized.  This is
         used to return the size of any extra components not in the
@@ -135,6 +238,66 @@ class EMR_UNKNOWN(Record): # extend from new-style class, or __getattr__ doesn't
         return "**%s: iType=%s nSize=%s  struct='%s' size=%d extra=%d\n%s%s" % (self.__class__.__name__.lstrip('_'),self.iType,self.nSize,self.format.fmt,self.format.minstructsize,self.sizeExtra(),details,ret)
         return
 
+class RAW(EMR_UNKNOWN):
+    """Opaque record of any type that hasn't been decoded.  The bytes
+    of the record after the iType and nSize prefix are kept in body as
+    they were read, and are written back out verbatim.  Assign to body
+    to change them.  Use L{decode} to get the parsed record."""
+    __slots__=('_body',)
+
+    def __init__(self,iType=0):
+        # one of these is created for every skipped record when
+        # loading, so fill in the slots directly rather than going
+        # through the properties
+        Record.__init__(self)
+        self._nSize=0
+        self._iType=iType
+        self._unhandleddata=None
+        self.verbose=False
+        self.datasize=0
+        self.error=0
+        self._body=b''
+
+    def _getBody(self):
+        return self._body
+
+    def _setBody(self,body):
+        self._body=body
+        self.data=None
+
+    body=property(_getBody,_setBody,doc="bytes of the record after the iType and nSize prefix")
+
+    def unserializeData(self,data,ptr=8,compact=False):
+        # body is the only copy of the bytes of the record, while data
+        # is just the cache that pack returns until the record is
+        # modified
+        self._body=memoryview(data)[8:]
+        self.data=data
+
+    def decode(self,compact=False):
+        """Return the fully decoded record."""
+        return fromBuffer(self.pack(),0,compact)
+
+    def getBounds(self):
+        return self.decode().getBounds()
+
+    def pack(self):
+        if not self.isModified():
+            return self.data
+        self.nSize=8+len(self.body)
+        data=struct.pack("<ii",self.iType,self.nSize)+bytes(self.body)
+        self.data=data
+        return data
+
+    def resize(self):
+        self.nSize=8+len(self.body)
+
+    def calcSize(self):
+        return 8+len(self.body)
+
+    def __str__(self):
+        return "**RAW: iType=%s nSize=%s\n" % (self.iType,self.nSize)
+
 @register_emr
 class HEADER(EMR_UNKNOWN):
     """Header has different fields depending on the version of
@@ -185,20 +348,17 @@ class HEADER(EMR_UNKNOWN):
             [dc.frame_right,dc.frame_bottom]
         ]
 
-        #print(self)
+        # assign new lists rather than changing the old ones in place,
+        # so that a loaded header can tell whether it has changed
         if scaleheader:
-            self.szlDevice[0]=dc.pixelwidth
-            self.szlDevice[1]=dc.pixelheight
-            self.szlMicrometers[0]=dc.width*10
-            self.szlMicrometers[1]=dc.height*10
+            self.szlDevice=[dc.pixelwidth,dc.pixelheight]
+            micrometers=[dc.width*10,dc.height*10]
         else:
-            self.szlDevice[0]=dc.ref_pixelwidth
-            self.szlDevice[1]=dc.ref_pixelheight
-            self.szlMicrometers[0]=dc.ref_width*10
-            self.szlMicrometers[1]=dc.ref_height*10
-
-        self.szlMillimeters[0]=self.szlMicrometers[0]//1000
-        self.szlMillimeters[1]=self.szlMicrometers[1]//1000
+            self.szlDevice=[dc.ref_pixelwidth,dc.ref_pixelheight]
+            # the reference size read from a header may be fractional
+            micrometers=[int(round(dc.ref_width*10)),int(round(dc.ref_height*10))]
+        self.szlMicrometers=micrometers
+        self.szlMillimeters=[micrometers[0]//1000,micrometers[1]//1000]
 
 
 @register_emr
@@ -899,6 +1059,7 @@ class EXTCREATEFONTINDIRECTW(EMR_UNKNOWN):
 class EXTTEXTOUTA(EMR_UNKNOWN):
     """ASCII-encoded text."""
     emr_id=83
+    charsize=1
     typedef=[
         (Points(num=2),'rclBounds',[[0,0],[-1,-1]]),
         ('i','iGraphicsMode',const.GM_COMPATIBLE),
@@ -919,7 +1080,6 @@ class EXTTEXTOUTA(EMR_UNKNOWN):
         self.ptlReference_x=x
         self.ptlReference_y=y
         self.string = txt
-        self.charsize=1
         self.dx=[]
 
 
@@ -927,6 +1087,7 @@ class EXTTEXTOUTA(EMR_UNKNOWN):
 class EXTTEXTOUTW(EXTTEXTOUTA):
     """UTF-16le-encoded text."""
     emr_id=84
+    charsize=2
     typedef=[
         (Points(num=2),'rclBounds',[[0,0],[-1,-1]]),
         ('i','iGraphicsMode',const.GM_COMPATIBLE),
@@ -945,7 +1106,6 @@ class EXTTEXTOUTW(EXTTEXTOUTA):
 
     def __init__(self,x=0,y=0,txt=''):
         EXTTEXTOUTA.__init__(self,x,y,txt)
-        self.charsize=2
 
 
 def EXTTEXTOUT_auto(x, y, txt):
@@ -0,0 +1,118 @@
+import gzip
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# EMZ files are EMF files compressed with gzip
+magic=b'\x1f\x8b'
+
+def isCompressed(data):
+    """Return True if data starts with the gzip magic number."""
+    return bytes(data[:2])==magic
+
+def isEMZName(filename):
+    """Return True if the filename has the .emz extension."""
+    if isinstance(filename,bytes):
+        return filename.lower().endswith(b'.emz')
+    return str(filename).lower().endswith('.emz')
+
+def openInput(fh):
+    """Return a file object that reads decompressed data if the binary
+    file object fh holds gzip data, or fh itself if it doesn't.  The
+    data is decompressed as it is read, not all at once."""
+    if hasattr(fh,'peek'):
+        start=fh.peek(2)[:2]
+    elif fh.seekable():
+        pos=fh.tell()
+        start=fh.read(2)
+        fh.seek(pos)
+    else:
+        return fh
+    if isCompressed(start):
+        return gzip.GzipFile(fileobj=fh,mode='rb')
+    return fh
+
+def openOutput(fh,level=9):
+    """Return a file object that writes gzip compressed data to fh.
+    The modification time and file name aren't stored, so the same EMF
+    always compresses to the same bytes."""
+    return gzip.GzipFile(filename='',fileobj=fh,mode='wb',compresslevel=level,mtime=0)
+
+def decompress(data):
+    """Decompress a buffer holding an entire EMZ file."""
+    return gzip.decompress(data)
+
+class Decompressor:
+    """Incremental gzip decompressor for data that arrives in pieces,
+    including files made of several concatenated gzip members.  Zero
+    bytes after a member are skipped, as L{gzip.GzipFile} does, since
+    EMZ files are often padded with them."""
+
+    def __init__(self):
+        self.obj=zlib.decompressobj(wbits=31)
+
+    def decompress(self,data):
+        out=[]
+        while data:
+            if self.obj is None:
+                # between members, where there may be zero padding
+                data=bytes(data).lstrip(b'\0')
+                if not data:
+                    break
+                self.obj=zlib.decompressobj(wbits=31)
+            out.append(self.obj.decompress(data))
+            if not self.obj.eof:
+                break
+            # the rest of the data, if any, starts the next member
+            data=self.obj.unused_data
+            self.obj=None
+        return b''.join(out)
+
+def _deflateBlock(data,level):
+    # every block is a complete raw deflate stream without the final
+    # block marker, so blocks can be concatenated in any number
+    c=zlib.compressobj(level,zlib.DEFLATED,-15)
+    return c.compress(data)+c.flush(zlib.Z_SYNC_FLUSH)
+
+def writeCompressed(fh,chunks,level=9,threads=None):
+    """
+Write the data in chunks to the binary file object fh as a single gzip
+member.  If threads is more than 1, each chunk is deflated on its own
+in a pool of threads, which zlib allows to run in parallel.  The
+chunks are still written in order, and only a few of them are held in
+memory at a time.  Because the history isn't shared between chunks,
+chunks should be large (a megabyte or so) to keep the compression
+ratio close to that of a single stream.
+
+@param fh: file object to write to
+@param chunks: iterable of bytes-like objects
+@param level: zlib compression level
+@type level: int
+@param threads: number of compression threads
+@type threads: int
+    """
+    if threads is None or threads<=1:
+        out=openOutput(fh,level)
+        for data in chunks:
+            out.write(data)
+        out.close()
+        return
+
+    # gzip header: deflate, no flags, no mtime, unknown OS
+    xfl=2 if level==9 else (4 if level==1 else 0)
+    fh.write(magic+struct.pack("<BBIBB",8,0,0,xfl,255))
+    crc=0
+    size=0
+    pending=[]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for data in chunks:
+            crc=zlib.crc32(data,crc)
+            size+=len(data)
+            pending.append(pool.submit(_deflateBlock,data,level))
+            if len(pending)>=2*threads:
+                fh.write(pending.pop(0).result())
+        for f in pending:
+            fh.write(f.result())
+    # empty final block ends the deflate stream
+    fh.write(zlib.compressobj(level,zlib.DEFLATED,-15).flush(zlib.Z_FINISH))
+    fh.write(struct.pack("<II",crc&0xffffffff,size&0xffffffff))
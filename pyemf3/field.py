@@ -1,5 +1,9 @@
+import sys
 import struct
+from array import array
 from io import StringIO, BytesIO
+from operator import attrgetter
+from collections.abc import MutableMapping
 
 def _round4(num):
     """Round to the nearest multiple of 4 greater than or equal to the
@@ -7,6 +11,156 @@ def _round4(num):
     boundaries."""
     return ((num+3)//4)*4
 
+def _arraycode(fmt):
+    """Return the array typecode with the same size and signedness as
+    the (single) struct format character in fmt."""
+    code=fmt.lstrip("<>@!=")[0]
+    size=struct.calcsize("<"+code)
+    if code.isupper():
+        candidates=code+"HILQ"
+    else:
+        candidates=code+"hilq"
+    for typecode in candidates:
+        if array(typecode).itemsize==size:
+            return typecode
+    raise TypeError("no array typecode matches struct format %s" % fmt)
+
+def _isNumpyArray(value):
+    """Return True if value is a NumPy array.  NumPy is optional and
+    is never imported here: if it hasn't been imported already, value
+    can't be one of its arrays."""
+    numpy=sys.modules.get('numpy')
+    return numpy is not None and isinstance(value,numpy.ndarray)
+
+def _checkNumpyType(value,fmt):
+    """Raise struct.error if the NumPy array value can't be packed
+    with the struct format character in fmt without losing precision,
+    like struct itself does for a float packed as an integer."""
+    code=fmt.lstrip("<>@!=")[0]
+    if code not in "fd" and value.dtype.kind not in "iu":
+        raise struct.error("can't pack NumPy array of %s as integers" % value.dtype)
+
+def _frombytes(typecode,data):
+    """Create an array from little-endian data with one bulk copy."""
+    values=array(typecode)
+    values.frombytes(data)
+    if sys.byteorder!='little':
+        values.byteswap()
+    return values
+
+def _tobytes(values):
+    """Return the contents of an array as little-endian bytes."""
+    if sys.byteorder!='little':
+        values=array(values.typecode,values)
+        values.byteswap()
+    return values.tobytes()
+
+class PointArray:
+    """Compact sequence of points, stored as a flat array of
+    interleaved coordinates rather than a list of lists.  Indexing
+    returns a tuple of coordinates; assign a whole point to change
+    one."""
+
+    def __init__(self,values,rank=2):
+        self.values=values
+        self.rank=rank
+
+    def __len__(self):
+        return len(self.values)//self.rank
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i<0:
+            i+=len(self)
+        if i<0 or i>=len(self):
+            raise IndexError("point index out of range")
+        start=i*self.rank
+        return tuple(self.values[start:start+self.rank])
+
+    def __setitem__(self,i,point):
+        if i<0:
+            i+=len(self)
+        start=i*self.rank
+        self.values[start:start+self.rank]=array(self.values.typecode,point)
+
+    def __iter__(self):
+        values=self.values
+        rank=self.rank
+        for start in range(0,len(values),rank):
+            yield tuple(values[start:start+rank])
+
+    def __eq__(self,other):
+        if isinstance(other,PointArray):
+            return self.rank==other.rank and self.values==other.values
+        try:
+            return len(self)==len(other) and all(tuple(a)==tuple(b) for a,b in zip(self,other))
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return "PointArray(%s)" % str(list(self))
+
+    def append(self,point):
+        self.values.extend(point)
+
+    def tobytes(self):
+        return _tobytes(self.values)
+
+    def asNumpy(self):
+        """Return an Nx2 NumPy view of the points.  The view shares
+        memory with this PointArray, so no points can be appended
+        while it exists."""
+        import numpy
+        return numpy.frombuffer(self.values,dtype=self.values.typecode).reshape(-1,self.rank)
+
+# types that calcNumBytes and calcNum treat as a list of items, along
+# with NumPy arrays
+sequencetypes=(list,tuple,array,PointArray)
+
+def _isSequence(value):
+    return isinstance(value,sequencetypes) or _isNumpyArray(value)
+
+def _changed(old,new):
+    """Return True if a field value has been changed.  Values may be
+    lists, arrays or NumPy arrays, which don't all compare equal to each
+    other even when they hold the same numbers.  Assigning a mutable
+    value back to the same field counts as a change, as it may have
+    been modified in place."""
+    if old is new:
+        return not isinstance(old,(int,float,str,bytes,tuple,type(None)))
+    if isinstance(old,array):
+        old=old.tolist()
+    if isinstance(new,array):
+        new=new.tolist()
+    try:
+        return bool(old!=new)
+    except ValueError:
+        return True
+
+def _slotName(name):
+    """Return the name of the slot that holds a field of a record."""
+    return '_'+name
+
+def _makeAssigner(slots):
+    """Return a function that assigns a sequence of values to the given
+    slots of an object in a single statement."""
+    if not slots:
+        return lambda obj,items: None
+    ns={}
+    exec("def assign(obj,items):\n    (%s,)=items\n" % ','.join('obj.'+slot for slot in slots),ns)
+    return ns['assign']
+
+def _makeGetter(slots):
+    """Return a function that returns the values of the given slots of
+    an object as a tuple."""
+    if len(slots)>1:
+        return attrgetter(*slots)
+    elif slots:
+        get=attrgetter(slots[0])
+        return lambda obj: (get(obj),)
+    return lambda obj: ()
+
 ##### - Field, Record, and related classes: a way to represent data
 ##### more advanced than using just import struct
 
@@ -36,9 +190,9 @@ class Field:
         return size
 
     def calcNumBytes(self,obj,name):
-        if isinstance(obj.values[name],list) or isinstance(obj.values[name],tuple):
-            size=self.size*len(obj.values[name])
-            if self.debug: print("  calcNumBytes: size=%d len(obj.values[%s])=%d total=%d" % (self.size,name,len(obj.values[name]),size))
+        if _isSequence(getattr(obj,name)):
+            size=self.size*len(getattr(obj,name))
+            if self.debug: print("  calcNumBytes: size=%d len(obj.values[%s])=%d total=%d" % (self.size,name,len(getattr(obj,name)),size))
             # also update the linked number, if applicable
         else:
             size=self.size*self.getNum(obj)
@@ -63,9 +217,9 @@ class Field:
         return False
 
     def calcNum(self,obj,name):
-        if isinstance(obj.values[name],list) or isinstance(obj.values[name],tuple):
-            num=len(obj.values[name])
-            ##if debug: print "calcNumBytes: size=%d num=%d" % (size,len(obj.values[name]))
+        if _isSequence(getattr(obj,name)):
+            num=len(getattr(obj,name))
+            ##if debug: print "calcNumBytes: size=%d num=%d" % (size,len(getattr(obj,name)))
             # also update the linked number, if applicable
         else:
             num=self.getNum(obj)
@@ -94,6 +248,32 @@ class Field:
     def pack(self,obj,name,value):
         raise NotImplementedError()
 
+    def unpackCompact(self,obj,name,data,ptr):
+        """Like unpack, but return a compact representation of the
+        value if the field has one."""
+        return self.unpack(obj,name,data,ptr)
+
+    def isFixed(self):
+        """Return True if this field always occupies the same number
+        of bytes at the same place in the record."""
+        return isinstance(self.num,int) and self.offset is None
+
+    def getStructFormat(self):
+        """Return the struct format characters (without a byte order
+        prefix) that decode this field, or None if the field can't be
+        decoded as part of a precompiled struct."""
+        return None
+
+    def fromStruct(self,items):
+        """Convert the values decoded using getStructFormat into the
+        value of this field."""
+        return items[0]
+
+    def toStruct(self,value):
+        """The reverse of fromStruct: return the items to pack with
+        getStructFormat for the value of this field."""
+        return (value,)
+
     def getDefault(self):
         return None
 
@@ -108,12 +288,15 @@ class StructFormat(Field):
         Field.__init__(self,fmt,struct.calcsize(fmt))
 
     def unpack(self,obj,name,data,ptr):
-        value=struct.unpack(self.fmt,data[ptr:ptr+self.size])[0]
+        value=struct.unpack_from(self.fmt,data,ptr)[0]
         return (value,self.size)
 
     def pack(self,obj,name,value):
         return struct.pack(self.fmt,value)
 
+    def getStructFormat(self):
+        return self.fmt.lstrip("<>@!=")
+
     def str_color(self,val):
         return "red=0x%02x green=0x%02x blue=0x%02x" % ((val&0xff),((val&0xff00)>>8),((val&0xff0000)>>16))
 
@@ -133,7 +316,7 @@ class String(Field):
     def calcNumBytes(self,obj,name):
         if self.hasNumReference():
             # If this is a dynamic string, calculate the size required
-            txt=obj.values[name]
+            txt=getattr(obj,name)
             if self.size==2:
                 # it's unicode, so get the number of actual bytes required
                 # to store it
@@ -146,7 +329,7 @@ class String(Field):
 
     def calcNum(self,obj,name):
         if self.hasNumReference():
-            return len(obj.values[name])
+            return len(getattr(obj,name))
         else:
             return Field.calcNumBytes(self,obj,name)
 
@@ -160,7 +343,7 @@ class String(Field):
             return ('',0)
 
         size=self.getNumBytes(obj)
-        txt=data[ptr:ptr+size]
+        txt=bytes(data[ptr:ptr+size])
         if self.size==2:
             txt=txt.decode('utf-16') # Now is a unicode string
         if self.debug:
@@ -222,18 +405,44 @@ class List(Field):
             return (values,0)
 
         num=self.getNum(obj)
-        while num>0:
-            values.append(struct.unpack(self.fmt,data[ptr:ptr+self.size])[0])
-            ptr+=self.size
-            num-=1
+        if num>0:
+            values=list(struct.unpack_from("<%d%s" % (num,self.fmt.lstrip("<>@!=")),data,ptr))
         return (values,self.getNumBytes(obj))
 
+    # decode into an array with one bulk copy
+    def unpackCompact(self,obj,name,data,ptr):
+        offset=self.getOffset(obj)
+        if offset==None:
+            pass
+        elif offset>0:
+            ptr=offset
+        else:
+            return (array(_arraycode(self.fmt)),0)
+
+        size=self.getNumBytes(obj)
+        values=_frombytes(_arraycode(self.fmt),memoryview(data)[ptr:ptr+size])
+        if len(values)*values.itemsize<size:
+            raise struct.error("unpack requires a buffer of %d bytes" % size)
+        return (values,size)
+
     def pack(self,obj,name,value):
-        fh=BytesIO()
-        size=0
-        for val in value:
-            fh.write(struct.pack(self.fmt,val))
-        return fh.getvalue()
+        if isinstance(value,array) and value.itemsize==self.size:
+            return _tobytes(value)
+        if _isNumpyArray(value):
+            _checkNumpyType(value,self.fmt)
+            return value.astype("<"+self.fmt.lstrip("<>@!="),order='C',copy=False).tobytes()
+        return struct.pack("<%d%s" % (len(value),self.fmt.lstrip("<>@!=")),*value)
+
+    def getStructFormat(self):
+        if self.isFixed():
+            return self.fmt*self.num
+        return None
+
+    def fromStruct(self,items):
+        return list(items)
+
+    def toStruct(self,value):
+        return value
 
     def getDefault(self):
         return self.default
@@ -269,21 +478,62 @@ class Tuples(Field):
 
         num=self.getNum(obj)
         if self.debug: print("unpack: name=%s num=%d ptr=%d datasize=%d" % (name,num,ptr,len(data)))
-        while num>0:
-            values.append(list(struct.unpack(self.fmt,data[ptr:ptr+self.size])))
-            ptr+=self.size
-            num-=1
+        if num>0:
+            view=memoryview(data)[ptr:ptr+num*self.size]
+            values=[list(item) for item in struct.iter_unpack("<"+self.fmt.lstrip("<>@!="),view)]
         return (values,self.getNumBytes(obj))
 
+    # decode into a PointArray with one bulk copy
+    def unpackCompact(self,obj,name,data,ptr):
+        typecode=_arraycode(self.fmt)
+        offset=self.getOffset(obj)
+        if offset==None:
+            pass
+        elif offset>0:
+            ptr=offset
+        else:
+            return (PointArray(array(typecode),self.rank),0)
+
+        size=self.getNumBytes(obj)
+        values=_frombytes(typecode,memoryview(data)[ptr:ptr+size])
+        if len(values)*values.itemsize<size:
+            raise struct.error("unpack requires a buffer of %d bytes" % size)
+        return (PointArray(values,self.rank),size)
+
     # assuming a list of lists
     def pack(self,obj,name,value):
-        fh=BytesIO()
-        size=0
+        if isinstance(value,PointArray) and value.values.itemsize*self.rank==self.size:
+            return value.tobytes()
+        if _isNumpyArray(value):
+            _checkNumpyType(value,self.fmt)
+            return value.astype("<"+self.fmt.lstrip("<>@!=")[0],order='C',copy=False).tobytes()
         if self.debug: print("pack: value=%s" % (str(value)))
+        items=self.toStruct(value)
+        if len(items)==len(value)*self.rank:
+            return struct.pack("<%d%s" % (len(items),self.fmt.lstrip("<>@!=")[0]),*items)
+        # some of the points have the wrong number of coordinates, so
+        # let struct complain about the first one
+        fh=BytesIO()
         for val in value:
             fh.write(struct.pack(self.fmt,*val))
         return fh.getvalue()
 
+    def getStructFormat(self):
+        if self.isFixed():
+            return self.fmt.lstrip("<>@!=")*self.num
+        return None
+
+    def fromStruct(self,items):
+        rank=self.rank
+        return [list(items[i:i+rank]) for i in range(0,len(items),rank)]
+
+    def toStruct(self,value):
+        if isinstance(value,PointArray):
+            return value.values
+        if _isNumpyArray(value):
+            return value.reshape(-1).tolist()
+        return [item for point in value for item in point]
+
     def getDefault(self):
         # FIXME: need to take account of number
         return self.default
@@ -327,6 +577,7 @@ class RecordFormat:
 
         self.fmt=''
         self.setFormat(typedef)
+        self.compile()
 
     def getDefaults(self):
         values={}
@@ -369,7 +620,64 @@ class RecordFormat:
         self.minstructsize+=self.fmtmap[name].getNumBytes()
         self.names.append(name)
 
+    def compile(self):
+        """Combine the leading run of fixed size fields into a single
+        precompiled struct, so they can be decoded with one call.  Only
+        the fields after the first variable length one are decoded
+        individually."""
+        fmt=self.endian
+        # list of (name, typecode object, index of first item, number
+        # of items, True if the value is a plain scalar)
+        self.prefix=[]
+        count=0
+        for name in self.names:
+            fmtobj=self.fmtmap[name]
+            code=fmtobj.getStructFormat()
+            if code is None:
+                break
+            fmt+=code
+            numitems=len(struct.unpack(self.endian+code,b'\0'*struct.calcsize(self.endian+code)))
+            self.prefix.append((name,fmtobj,count,numitems,isinstance(fmtobj,StructFormat)))
+            count+=numitems
+        self.prefixstruct=struct.Struct(fmt)
+        self.remaining=self.names[len(self.prefix):]
+
+        # if every field in the prefix is a scalar, the decoded items
+        # map one to one onto the names
+        self.scalarprefix=None
+        if all(scalar for name,fmt,start,numitems,scalar in self.prefix):
+            self.scalarprefix=[name for name,fmt,start,numitems,scalar in self.prefix]
+            slots=[_slotName(name) for name in self.scalarprefix]
+            self.getprefix=_makeGetter(slots)
+            self.setprefix=_makeAssigner(slots)
+
+        # all the fields are set to their defaults in one go when a
+        # record is created
+        self.defaults=tuple(self.default[name] for name in self.names)
+        self.setdefaults=_makeAssigner([_slotName(name) for name in self.names])
+
+        # the remaining fields are packed one by one, filling in the
+        # offset and count fields that refer to them.  List of (name,
+        # typecode object, name of offset field, name of count field)
+        self.tail=[]
+        targets=set()
+        for name in self.remaining:
+            fmtobj=self.fmtmap[name]
+            offsetref=fmtobj.hasOffsetReference() or None
+            numref=fmtobj.hasNumReference() or None
+            self.tail.append((name,fmtobj,offsetref,numref))
+            targets.update((offsetref,numref))
+        # offset and count fields in the tail, which have to be packed
+        # again once the values they refer to are known
+        self.tailtargets=[i for i,item in enumerate(self.tail) if item[0] in targets]
+
     def calcNumBytes(self,obj):
+        if not self.debug:
+            # the fields in the prefix always have the same size
+            size=self.prefixstruct.size
+            for name,fmt,offsetref,numref in self.tail:
+                size+=fmt.calcNumBytes(obj,name)
+            return size
         size=0
         for name in self.names:
             fmt=self.fmtmap[name]
@@ -378,25 +686,90 @@ class RecordFormat:
             size+=nbytes
         return size
 
-    def unpack(self,data,obj,initptr=0):
+    def unpack(self,data,obj,initptr=0,compact=False):
+        """Decode the fields of the record into obj, starting at
+        initptr.  If compact is True, variable length lists and points
+        are stored as arrays instead of lists.  Returns the position
+        after the last field.  The values are stored straight into the
+        slots of obj, without marking it as modified."""
         ptr=initptr
-        obj.values={}
         if self.minstructsize+ptr>0:
             if self.minstructsize+ptr>len(data):
                 # we have a problem.  More stuff to unparse than
                 # we have data.  Hmmm.  Fill with binary zeros
                 # till I think of a better idea.
-                data+="\0"*(self.minstructsize+ptr-len(data))
-            for name in self.names:
+                data=bytes(data)+b"\0"*(self.minstructsize+ptr-len(data))
+            if self.scalarprefix:
+                self.setprefix(obj,self.prefixstruct.unpack_from(data,ptr))
+                ptr+=self.prefixstruct.size
+            elif self.prefix:
+                items=self.prefixstruct.unpack_from(data,ptr)
+                for name,fmt,start,numitems,scalar in self.prefix:
+                    if scalar:
+                        setattr(obj,_slotName(name),items[start])
+                    else:
+                        setattr(obj,_slotName(name),fmt.fromStruct(items[start:start+numitems]))
+                ptr+=self.prefixstruct.size
+            for name in self.remaining:
                 fmt=self.fmtmap[name]
-                (value,size)=fmt.unpack(obj,name,data,ptr)
+                if compact:
+                    (value,size)=fmt.unpackCompact(obj,name,data,ptr)
+                else:
+                    (value,size)=fmt.unpack(obj,name,data,ptr)
                 #if fmt.fmt=="<i": value=0
                 #if self.debug: print "name=%s fmt=%s value=%s" % (name,fmt.fmt,str(value))
-                obj.values[name]=value
+                setattr(obj,_slotName(name),value)
                 ptr+=size
         return ptr
 
-    def pack(self,values,obj,alreadypacked=0):
+    def pack(self,obj,alreadypacked=0):
+        """Return the packed bytes of the fields of obj.  alreadypacked
+        is the number of bytes in the record before the first field,
+        which offsets are measured from.  Offset and count fields that
+        refer to variable length fields are updated as they are
+        packed."""
+        try:
+            return self.packCompiled(obj,alreadypacked)
+        except (struct.error,TypeError,ValueError,AttributeError):
+            # pack field by field to report which one is wrong
+            return self.packFields(obj.values,obj,alreadypacked)
+
+    def packCompiled(self,obj,alreadypacked=0):
+        """Pack using the precompiled struct for the fixed size prefix
+        of the record.  The variable length fields after the prefix are
+        packed first so that the offsets and counts referring to them
+        are known before anything else is packed."""
+        tail=[]
+        if self.tail:
+            size=self.prefixstruct.size+alreadypacked
+            for name,fmt,offsetref,numref in self.tail:
+                data=fmt.pack(obj,name,getattr(obj,name))
+                if data:
+                    if offsetref:
+                        setattr(obj,_slotName(offsetref),size)
+                    if numref:
+                        setattr(obj,_slotName(numref),fmt.calcNum(obj,name))
+                tail.append(data)
+                size+=len(data)
+            for i in self.tailtargets:
+                name,fmt,offsetref,numref=self.tail[i]
+                tail[i]=fmt.pack(obj,name,getattr(obj,name))
+
+        if self.scalarprefix is not None:
+            head=self.prefixstruct.pack(*self.getprefix(obj))
+        else:
+            items=[]
+            for name,fmt,start,numitems,scalar in self.prefix:
+                if scalar:
+                    items.append(getattr(obj,name))
+                else:
+                    items.extend(fmt.toStruct(getattr(obj,name)))
+            head=self.prefixstruct.pack(*items)
+        if tail:
+            return head+b''.join(tail)
+        return head
+
+    def packFields(self,values,obj,alreadypacked=0):
         fh=BytesIO()
         size=0
         output={}
@@ -442,7 +815,7 @@ class RecordFormat:
 
         for name in self.names:
             fmt=self.fmtmap[name]
-            val=fmt.getString(name,obj.values[name])
+            val=fmt.getString(name,getattr(obj,name))
             try:
                 txt.write("\t%-20s: %s\n" % (name,val))
             except UnicodeEncodeError:
@@ -450,53 +823,148 @@ class RecordFormat:
         return txt.getvalue()
 
 
-class Record:
+class RecordValues(MutableMapping):
+    """Dict-like view of the fields of a record.  Records used to keep
+    their fields in a dict named values, and this keeps code that
+    reads or assigns fields through it working."""
+
+    __slots__=('record',)
+
+    def __init__(self,record):
+        self.record=record
+
+    def __getitem__(self,name):
+        if name not in self.record.format.fmtmap:
+            raise KeyError(name)
+        return getattr(self.record,name)
+
+    def __setitem__(self,name,value):
+        if name not in self.record.format.fmtmap:
+            raise KeyError(name)
+        setattr(self.record,name,value)
+
+    def __delitem__(self,name):
+        raise TypeError("fields of a record can't be deleted")
+
+    def __contains__(self,name):
+        return name in self.record.format.fmtmap
+
+    def __iter__(self):
+        return iter(self.record.format.names)
+
+    def __len__(self):
+        return len(self.record.format.names)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+def _fieldProperty(name):
+    """Return the property for a field, which reads the slot directly
+    and marks the record as modified when a different value is
+    assigned."""
+    slot=_slotName(name)
+    get=attrgetter(slot)
+
+    def set(self,value):
+        # A record keeps the bytes it was loaded from, or was last
+        # packed into, in self.data and writes them back out unchanged
+        # until one of its fields is assigned a different value.
+        if self.data is not None and _changed(getattr(self,slot,None),value):
+            self.data=None
+        setattr(self,slot,value)
+
+    return property(get,set,doc="%s field of the record" % name)
+
+class RecordClass(type):
+    """
+Metaclass for records that builds the L{RecordFormat} of each class
+from its typedef when the class is created.  Every field, and every
+name in the framing attribute, gets a slot and a property of the same
+name that reads it.  Records therefore don't need an instance dict,
+and their fields are read without going through C{__getattr__}.  The
+slot of a field is its name with an underscore in front.
+    """
+
+    def __new__(mcls,name,bases,ns):
+        base=None
+        for b in bases:
+            if isinstance(b,RecordClass):
+                base=b
+                break
+        typedef=ns.get('typedef',base.typedef if base is not None else ())
+        if base is not None and base.format is not None and base.format.typedef==typedef:
+            format=base.format
+        else:
+            format=RecordFormat(typedef)
+        framing=ns.get('framing',getattr(base,'framing',()))
+
+        # fields that already have a slot in a base class
+        have=set()
+        for b in bases:
+            have.update(getattr(b,'fieldnames',()))
+        allfields=list(format.names)+list(framing)
+        fields=[n for n in allfields if n not in have]
+        for n in allfields:
+            if n in ns:
+                raise TypeError("%s.%s is both a field and a class attribute" % (name,n))
+        ns['__slots__']=tuple(ns.get('__slots__',()))+tuple(_slotName(n) for n in fields)
+
+        cls=type.__new__(mcls,name,bases,ns)
+        for n in fields:
+            setattr(cls,n,_fieldProperty(n))
+        cls.fieldnames=frozenset(have.union(fields))
+        cls.format=format
+
+        # every slot of the record, for pickling
+        slots=[]
+        for klass in reversed(cls.__mro__):
+            for slot in klass.__dict__.get('__slots__',()):
+                if slot not in ('__dict__','__weakref__'):
+                    slots.append(slot)
+        cls.allslots=tuple(slots)
+        return cls
+
+class Record(metaclass=RecordClass):
     """baseclass for binary records"""
 
+    # data holds the bytes the record was decoded from, or None.
+    # Attributes that aren't fields still go in an instance dict.
+    __slots__=('data','__dict__','__weakref__')
+
     format=None
     typedef=()
 
     def __init__(self):
-        # if we've never seen this class before, create a new format.
-        # Note that subclasses of classes that we have already seen
-        # pick up any undefined class attributes from their
-        # superclasses, so we have to check if this is a subclass with
-        # a different typedef
-        if self.__class__.format==None or self.__class__.typedef != self.format.typedef:
-            # if self.debug: print "creating format for %d" % id
-            self.__class__.format=RecordFormat(self.__class__.typedef)
-
-        # list of values parsed from the input stream
-        self.values=self.__class__.format.getDefaults()
-
-    def __getattr__(self,name):
-        """Return EMR attribute if the name exists in the typedef list
-        of the object.  This is only called when the standard
-        attribute lookup fails on this object, so we don't have to
-        handle the case where name is an actual attribute of self."""
-        f=Record.__getattribute__(self,'format')
-        try:
-            if name in f.names:
-                v=Record.__getattribute__(self,'values')
-                return v[name]
-        except IndexError:
-            raise IndexError("name=%s index=%d values=%s" % (name,index,str(v)))
-        raise AttributeError("%s not defined in EMR object" % name)
-
-    def __setattr__(self,name,value):
-        """Set a value in the object, propagating through to
-        self.values[] if the name is in the typedef list."""
-        f=Record.__getattribute__(self,'format')
-        try:
-            if f and name in f.names:
-                v=Record.__getattribute__(self,'values')
-                v[name]=value
-            else:
-                # it's not an automatically serializable item, so store it.
-                self.__dict__[name]=value
-        except IndexError:
-            raise IndexError("name=%s index=%d values=%s" % (name,index,str(v)))
+        self.data=None
+        fmt=self.format
+        fmt.setdefaults(self,fmt.defaults)
 
+    def _getValues(self):
+        return RecordValues(self)
+
+    def _setValues(self,values):
+        RecordValues(self).update(values)
+
+    values=property(_getValues,_setValues,doc="dict-like view of the fields, see L{RecordValues}")
+
+    def __getstate__(self):
+        """Return the state for pickling.  Records decoded from a
+        buffer hold memoryviews into it, which are converted to bytes."""
+        state={}
+        for slot in self.allslots:
+            try:
+                state[slot]=getattr(self,slot)
+            except AttributeError:
+                pass
+        state.update(self.__dict__)
+        for name,value in state.items():
+            if isinstance(value,memoryview):
+                state[name]=bytes(value)
+        return state
+
+    def __setstate__(self,state):
+        for name,value in state.items():
+            object.__setattr__(self,name,value)
 
 
 
@@ -509,7 +977,7 @@ class EMFString(Field):
     def calcNumBytes(self,obj,name):
         if self.hasNumReference():
             # If this is a dynamic string, calculate the size required
-            txt=obj.values[name]
+            txt=getattr(obj,name)
             if self.size==2:
                 # it's unicode, so get the number of actual bytes required
                 # to store it
@@ -523,7 +991,7 @@ class EMFString(Field):
 
     def calcNum(self,obj,name):
         if self.hasNumReference():
-            return len(obj.values[name])
+            return len(getattr(obj,name))
         else:
             return Field.calcNumBytes(self,obj,name)
 
@@ -541,14 +1009,34 @@ class EMFString(Field):
         size=_round4(len(txt))
 
         if self.size == 2:
-            txt = txt.decode('utf-16le')
+            txt = str(txt, 'utf-16le')
         else:
-            txt = txt.decode('ascii')
+            txt = str(txt, 'ascii')
 
         if self.debug:
             print("str: '%s'" % str(txt))
         return (txt,size)
 
+    def getStructFormat(self):
+        if self.isFixed():
+            size=self.getNumBytes()
+            extra=_round4(size)-size
+            if extra>0:
+                return "%ds%dx" % (size,extra)
+            return "%ds" % size
+        return None
+
+    def fromStruct(self,items):
+        if self.size == 2:
+            return items[0].decode('utf-16le')
+        return items[0].decode('ascii')
+
+    def toStruct(self,value):
+        # struct pads or truncates to the fixed size
+        if self.size == 2:
+            return (value.encode('utf-16le'),)
+        return (value.encode('ascii'),)
+
     def pack(self, obj, name, value):
         txt = value
         if self.size == 2:
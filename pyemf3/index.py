@@ -0,0 +1,254 @@
+import os
+import struct
+from array import array
+
+from . import emr
+from . import emz
+from .field import _frombytes, _tobytes
+
+# sidecar index file header: magic, size and mtime of the indexed file,
+# number of records and number of distinct record types
+_sidecarmagic=b"PYEMFIX1"
+_sidecarheader=struct.Struct("<8sqqii")
+
+def sidecarName(filename):
+    """Return the name of the sidecar index file for an EMF file."""
+    return os.fsdecode(filename)+".idx"
+
+def _fileStamp(filename):
+    st=os.stat(filename)
+    return (st.st_size,st.st_mtime_ns)
+
+class RecordIndex:
+    """Offsets, types and sizes of every record in an EMF file, stored
+    in compact arrays.  The index is built by walking the (iType,nSize)
+    chain at the start of each record without decoding anything, and
+    records are only decoded when asked for through L{get_record} or
+    L{records_of_type}.  The file is kept open for reading records
+    until L{close} is called, which a C{with} block does on exit::
+
+        with build_index("map.emf") as index:
+            for e in index.records_of_type(emr.EXTTEXTOUTW.emr_id):
+                print(e.string)
+    """
+
+    def __init__(self,filename=None):
+        self.filename=filename
+        # the file records are read from, which for an EMZ file is a
+        # decompressing wrapper around rawfh
+        self.fh=None
+        self.rawfh=None
+        # whether rawfh was opened by the index, rather than passed in
+        self.ownsfile=False
+
+        # (size,mtime) of the file when it was indexed
+        self.stamp=None
+        # cached number of records of each type
+        self.counts=None
+
+        self.offsets=array('q')
+        self.types=array('i')
+        self.sizes=array('i')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self,offset,iType,nSize):
+        self.counts=None
+        self.offsets.append(offset)
+        self.types.append(iType)
+        self.sizes.append(nSize)
+
+    def scan(self,fh):
+        """Read just the 8 byte (iType,nSize) prefix of each record in
+        the file object, seeking past the body of the record."""
+        offset=fh.tell()
+        while True:
+            data=fh.read(8)
+            if len(data)<8:
+                break
+            (iType,nSize)=struct.unpack("<ii",data)
+            self.add(offset,iType,nSize)
+            nSize=max(nSize,8)
+            offset+=nSize
+            fh.seek(nSize-8,os.SEEK_CUR)
+
+    def scanBuffer(self,buf):
+        """Walk the (iType,nSize) chain of a buffer holding the whole
+        file."""
+        end=len(buf)
+        ptr=0
+        while ptr+8<=end:
+            (iType,nSize)=struct.unpack_from("<ii",buf,ptr)
+            self.add(ptr,iType,nSize)
+            ptr+=max(nSize,8)
+
+    def countTypes(self):
+        """Return a dict of the number of records of each type."""
+        if self.counts is None:
+            counts={}
+            for iType in self.types:
+                counts[iType]=counts.get(iType,0)+1
+            self.counts=counts
+        return dict(self.counts)
+
+    def isCurrent(self):
+        """Return True if the indexed file hasn't changed size or
+        modification time since it was indexed."""
+        try:
+            return self.stamp is not None and self.stamp==_fileStamp(self.filename)
+        except (OSError,TypeError):
+            return False
+
+    def save(self,idxfilename=None):
+        """Write the index to a sidecar file, by default the name of the
+        EMF file with C{.idx} appended.  The file is written to a
+        temporary name and renamed into place, so concurrent readers
+        never see a partial index."""
+        if idxfilename is None:
+            idxfilename=sidecarName(self.filename)
+        if self.stamp is None:
+            self.stamp=_fileStamp(self.filename)
+        counts=sorted(self.countTypes().items())
+        tmpname="%s.%d.tmp" % (idxfilename,os.getpid())
+        with open(tmpname,'wb') as fh:
+            fh.write(_sidecarheader.pack(_sidecarmagic,self.stamp[0],self.stamp[1],len(self),len(counts)))
+            for iType,count in counts:
+                fh.write(struct.pack("<ii",iType,count))
+            fh.write(_tobytes(self.offsets))
+            fh.write(_tobytes(self.types))
+            fh.write(_tobytes(self.sizes))
+        os.replace(tmpname,idxfilename)
+
+    def open(self):
+        """Return the file object records are read from, opening the
+        indexed file if it isn't open yet."""
+        if self.fh is None:
+            self.rawfh=open(self.filename,'rb')
+            self.ownsfile=True
+            self.fh=emz.openInput(self.rawfh)
+        return self.fh
+
+    def close(self):
+        """Close the file records are read from.  A file object the
+        index was built from is left open, as it belongs to the
+        caller."""
+        if self.fh is not None:
+            if self.fh is not self.rawfh:
+                # decompressing wrapper, which leaves rawfh open
+                self.fh.close()
+            self.fh=None
+        if self.rawfh is not None:
+            if self.ownsfile:
+                self.rawfh.close()
+            self.rawfh=None
+            self.ownsfile=False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exctype,exc,tb):
+        self.close()
+
+    def get_record(self,i,compact=False):
+        """Read and decode record i from the file."""
+        fh=self.open()
+        fh.seek(self.offsets[i])
+        return emr.fromBuffer(fh.read(max(self.sizes[i],8)),0,compact)
+
+    def records_of_type(self,iType,compact=False):
+        """Generator that decodes each record of the given type in
+        turn, in file order."""
+        for i in range(len(self.types)):
+            if self.types[i]==iType:
+                yield self.get_record(i,compact)
+
+    def indices_of_type(self,iType):
+        """Return the list of record numbers of the given type."""
+        return [i for i in range(len(self.types)) if self.types[i]==iType]
+
+def load_index(filename,idxfilename=None):
+    """
+Read the sidecar index of an EMF file written by L{RecordIndex.save}.
+
+@param filename: the EMF file
+@type filename: string
+@param idxfilename: the sidecar file, defaults to filename + C{.idx}
+@type idxfilename: string
+@return: the index, or None if there isn't a sidecar file or it is
+out of date with respect to the size or modification time of the EMF
+file.
+@rtype: L{RecordIndex}
+    """
+    if idxfilename is None:
+        idxfilename=sidecarName(filename)
+    try:
+        stamp=_fileStamp(filename)
+        with open(idxfilename,'rb') as fh:
+            data=fh.read()
+    except OSError:
+        return None
+
+    if len(data)<_sidecarheader.size:
+        return None
+    (magic,size,mtime,num,ntypes)=_sidecarheader.unpack_from(data,0)
+    if magic!=_sidecarmagic or (size,mtime)!=stamp:
+        return None
+    ptr=_sidecarheader.size
+    if len(data)!=ptr+8*ntypes+16*num:
+        return None
+
+    index=RecordIndex(filename)
+    index.stamp=stamp
+    index.counts=dict(struct.iter_unpack("<ii",data[ptr:ptr+8*ntypes]))
+    ptr+=8*ntypes
+    index.offsets=_frombytes('q',data[ptr:ptr+8*num])
+    ptr+=8*num
+    index.types=_frombytes('i',data[ptr:ptr+4*num])
+    ptr+=4*num
+    index.sizes=_frombytes('i',data[ptr:ptr+4*num])
+    return index
+
+def build_index(source,sidecar=False):
+    """
+Build a L{RecordIndex} of an EMF file by reading only the record
+prefixes.  Any record can then be decoded directly with
+L{RecordIndex.get_record} without parsing the ones before it.  Call
+L{RecordIndex.close} when done with the index, or use it in a C{with}
+block, to close the file it reads from.
+
+If source is a filename and an up to date sidecar index file exists
+(see L{load_index}), it is used instead of scanning the file.
+Sidecar files belong to a filename, so they aren't read or written
+for a file object.  Besides this function, they are only used by lazy
+and parallel loads; L{EMF.load<emf.EMF.load>} without those options
+reads every record anyway.
+
+An EMZ file is indexed by the offsets of the records in the
+decompressed data.  Reading records from it works, but seeking
+backwards means decompressing again from the start of the file.
+
+@param source: filename or seekable binary file object
+@type source: string or file
+@param sidecar: write a sidecar index file if there isn't a current one
+@type sidecar: Boolean
+@return: the index of the file
+@rtype: L{RecordIndex}
+@raise ValueError: if sidecar is True and source isn't a filename
+    """
+    if isinstance(source,(str,bytes,os.PathLike)):
+        index=load_index(source)
+        if index is None:
+            index=RecordIndex(source)
+            index.stamp=_fileStamp(source)
+            index.scan(index.open())
+            if sidecar:
+                index.save()
+    else:
+        if sidecar:
+            raise ValueError("A sidecar index can only be written for an EMF file given by name")
+        index=RecordIndex()
+        index.rawfh=source
+        index.fh=emz.openInput(source)
+        index.scan(index.fh)
+    return index
@@ -0,0 +1,212 @@
+import os
+import mmap
+import multiprocessing
+from bisect import bisect_left
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from . import emr
+from . import emf
+
+# records being written by packParallel, which forked workers inherit
+# instead of having them pickled
+_saving=None
+
+def _decodeRange(filename,start,end,compact=False,decode=None):
+    """Decode the records between byte offsets start and end of a file.
+    This runs in a worker process, which maps the file itself so that
+    only the decoded records are sent back."""
+    records=[]
+    with open(filename,'rb') as fh:
+        buf=mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+    data=memoryview(buf)
+    ptr=start
+    while ptr<end:
+        e=emr.fromBuffer(data,ptr,compact,decode)
+        records.append(e)
+        ptr+=max(e.nSize,8)
+    # the records are pickled on the way back to the parent, which
+    # copies any memoryviews into the map
+    return records
+
+def _splitRuns(offsets,total,nchunks,start=0,end=None):
+    """Split the items from start to end-1, at the given ascending
+    byte offsets, into at most nchunks contiguous runs of roughly
+    total/nchunks bytes each.  Returns the index of the first item of
+    each run, followed by end."""
+    if end is None:
+        end=len(offsets)
+    bounds=[start]
+    for i in range(1,nchunks):
+        j=bisect_left(offsets,total*i//nchunks,0,end)
+        if j>bounds[-1] and j<end:
+            bounds.append(j)
+    bounds.append(end)
+    return bounds
+
+def splitIndex(index,filesize,nchunks):
+    """Split the records of a L{RecordIndex<index.RecordIndex>} into at
+    most nchunks contiguous runs of roughly equal size in bytes.
+    Returns a list of (start,end) byte offsets."""
+    offsets=index.offsets
+    if not len(offsets):
+        return [(0,filesize)]
+    bounds=[offsets[j] for j in _splitRuns(offsets,filesize,nchunks)[:-1]]
+    bounds.append(filesize)
+    return list(zip(bounds[:-1],bounds[1:]))
+
+def decodeParallel(filename,index,filesize,workers,compact=False,decode=None,records=None):
+    """
+Decode all the records of a file in a pool of worker processes.  The
+file is split into contiguous chunks on record boundaries taken from
+the index, and each worker decodes its chunks from its own read-only
+mmap of the file.  The decoded records are added to records one chunk
+at a time, in file order, so that any list-like container with an
+extend method can be filled, like a
+L{SpilledRecordList<records.SpilledRecordList>}.
+
+@param records: list to add the records to, or None for a new list
+@return: records
+    """
+    # a few chunks per worker, so a slow chunk doesn't hold up the rest
+    chunks=splitIndex(index,filesize,workers*4)
+    if records is None:
+        records=[]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures=[pool.submit(_decodeRange,filename,start,end,compact,decode) for start,end in chunks]
+        for f in futures:
+            records.extend(f.result())
+    return records
+
+def canFork():
+    """Return True if worker processes can be forked, which
+    L{packParallel} needs."""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def _packRange(filename,start,end,offset,size):
+    """Pack records start to end-1 of the records being saved and write
+    them to the file at offset.  This runs in a forked worker process.
+    Returns False, without writing, if the packed records aren't the
+    expected size."""
+    packed=[]
+    for i in range(start,end):
+        e=_saving[i]
+        if not isinstance(e,memoryview):
+            e=e.pack()
+        packed.append(e)
+    data=memoryview(b''.join(packed))
+    if len(data)!=size:
+        return False
+    fd=os.open(filename,os.O_WRONLY)
+    try:
+        while data:
+            n=os.pwrite(fd,data,offset)
+            data=data[n:]
+            offset+=n
+    finally:
+        os.close(fd)
+    return True
+
+def packParallel(filename,header,records,sizes,workers,chunksize=1<<26):
+    """
+Write an EMF file by packing its records in a pool of forked worker
+processes.  The offset of each record in the file is the sum of the
+sizes of the records before it, so the file is allocated at its full
+size first and each worker writes a contiguous run of records straight
+to its place in the file.
+
+@param filename: file to write
+@param header: packed header record
+@type header: bytes
+@param records: records to write, as records or memoryviews of their
+bytes; the first is the header, which isn't packed again
+@param sizes: size in bytes of each record, as packed
+@param workers: number of processes
+@type workers: int
+@param chunksize: maximum size of a run of records in bytes, which
+limits the memory used by each worker
+@type chunksize: int
+@return: False if any record didn't pack to its expected size, in
+which case the file is incomplete
+@rtype: Boolean
+    """
+    global _saving
+    offsets=list(accumulate(sizes,initial=0))
+    total=offsets[-1]
+    with open(filename,'wb') as fh:
+        fh.write(header)
+        fh.flush()
+        try:
+            os.posix_fallocate(fh.fileno(),0,total)
+        except (AttributeError,OSError):
+            fh.truncate(total)
+
+    # a few runs per worker, so a slow run doesn't hold up the rest
+    nchunks=max(workers*4,total//chunksize+1)
+    bounds=_splitRuns(offsets,total,nchunks,1,len(records))
+
+    _saving=records
+    try:
+        with ProcessPoolExecutor(max_workers=workers,mp_context=multiprocessing.get_context('fork')) as pool:
+            futures=[pool.submit(_packRange,filename,start,end,offsets[start],offsets[end]-offsets[start])
+                     for start,end in zip(bounds[:-1],bounds[1:]) if end>start]
+            return all(f.result() for f in futures)
+    finally:
+        _saving=None
+
+def _loadOne(filename,compact=False,decode=None,reduce=None):
+    """Load a single file in a worker process, returning the EMF or the
+    result of passing it to reduce.  Errors are returned rather than
+    raised so that one bad file doesn't stop the batch."""
+    try:
+        e=emf.EMF()
+        e.load(filename,compact=compact,decode=decode)
+        if reduce is not None:
+            return reduce(e)
+        return e
+    except Exception as exc:
+        return exc
+
+def load_many(filenames,workers=None,compact=True,decode=None,reduce=None):
+    """
+Load many EMF files concurrently in a pool of worker processes.  This
+is a generator that yields a (filename,result) tuple for each file as
+soon as it has been loaded, which is not necessarily in the order of
+filenames.  Only a couple of files per worker are in flight at any
+time, so memory use stays bounded however many files are given.
+
+The result is the loaded L{EMF<emf.EMF>}, or whatever reduce returns
+when called with it in the worker process.  reduce must be picklable,
+i.e. a module level function, and returning a small summary from it
+avoids sending every record back to this process.  If a file can't be
+loaded, the result is the exception that was raised.
+
+@param filenames: files to load
+@type filenames: iterable of strings
+@param workers: number of processes, defaults to the number of CPUs
+@type workers: int
+@param compact: store variable length fields as arrays, which is
+faster to send back from the workers
+@type compact: Boolean
+@param decode: record types to decode, as in L{EMF.load<emf.EMF.load>}
+@type decode: set of int
+@param reduce: function applied to each loaded EMF in the worker
+@type reduce: callable
+    """
+    if workers is None:
+        workers=os.cpu_count() or 1
+    filenames=iter(filenames)
+    maxpending=2*workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending={}
+        while True:
+            for filename in filenames:
+                f=pool.submit(_loadOne,filename,compact,decode,reduce)
+                pending[f]=filename
+                if len(pending)>=maxpending:
+                    break
+            if not pending:
+                break
+            done,notdone=wait(pending,return_when=FIRST_COMPLETED)
+            for f in done:
+                yield (pending.pop(f),f.result())
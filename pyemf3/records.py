@@ -0,0 +1,694 @@
+import copyreg
+import tempfile
+from array import array
+from collections import deque
+
+from . import emr
+from .field import _slotName, _arraycode, StructFormat, List, Tuples, PointArray
+from .index import RecordIndex
+
+class LazyRecordList:
+    """List-like container of EMR records backed by a buffer holding
+    an entire metafile, usually a read-only mmap of the file.  Only
+    the offset, iType and nSize of each record are kept until the
+    record is first accessed, at which point it is decoded from the
+    buffer and cached.  A decoded record holds a copy of its bytes
+    rather than a view of the buffer, so it stays usable after the
+    buffer is closed by L{close}.  Records appended after loading are
+    stored directly."""
+
+    def __init__(self,buf,compact=False,decode=None,index=None,filename=None):
+        self.buf=buf
+        # the file mapped into buf, if any
+        self.filename=filename
+        self.compact=compact
+        self.decode=decode
+
+        # compact per-record framing information
+        if index is None:
+            index=RecordIndex()
+            index.scanBuffer(buf)
+        self.index=index
+        self.offsets=index.offsets
+        self.types=index.types
+        self.sizes=index.sizes
+
+        # decoded records, or None if not yet accessed
+        self.records=[None]*len(self.offsets)
+
+    def materialize(self,i):
+        """Decode record i from the buffer."""
+        if self.buf is None:
+            raise ValueError("The file this EMF was lazily loaded from has been closed")
+        start=self.offsets[i]
+        data=self.buf[start:start+max(self.sizes[i],8)]
+        return emr.fromBuffer(data,0,self.compact,self.decode)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self.records)))]
+        e=self.records[i]
+        if e is None:
+            if i<0:
+                i+=len(self.records)
+            e=self.materialize(i)
+            self.records[i]=e
+        return e
+
+    def __setitem__(self,i,e):
+        self.records[i]=e
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def append(self,e):
+        self.records.append(e)
+
+    def extend(self,records):
+        self.records.extend(records)
+
+    def iterSaved(self):
+        """Iterate over the records for saving.  Records that have
+        never been accessed are returned as memoryviews of their
+        original bytes, so they can be written out without being
+        decoded."""
+        if self.buf is None:
+            raise ValueError("The file this EMF was lazily loaded from has been closed")
+        view=memoryview(self.buf)
+        nloaded=len(self.offsets)
+        for i,e in enumerate(self.records):
+            if e is None and i<nloaded and self.sizes[i]>=8:
+                start=self.offsets[i]
+                yield view[start:start+self.sizes[i]]
+            else:
+                yield self[i]
+
+    def isLoaded(self,i):
+        """Return True if record i has already been decoded."""
+        return self.records[i] is not None
+
+    def close(self):
+        """Close the buffer, which releases the mapped file.  Records
+        that haven't been decoded can't be read after this."""
+        if self.buf is not None:
+            if hasattr(self.buf,'close'):
+                self.buf.close()
+            self.buf=None
+            self.filename=None
+
+class SpilledRecordList:
+    """List-like container of EMR records that keeps the records held in
+    memory under a size limit, counted as the number of bytes they pack
+    to.  When the limit is exceeded, the records that have been in
+    memory longest are packed and written to a temporary file, and
+    dropped.  A spilled record is decoded from the file again when it
+    is accessed, and is then kept in memory until it is spilled again,
+    along with any changes made to it.  Changes made through a
+    reference kept after the record has been spilled are lost.  The
+    header and the newest record are never spilled."""
+
+    def __init__(self,limit,compact=False):
+        self.limit=limit
+        self.compact=compact
+
+        # records, or None if spilled
+        self.records=[]
+        # offset and size of the packed record in the spill file, or
+        # -1 if the record has never been spilled
+        self.offsets=array('q')
+        self.sizes=array('i')
+
+        # (index,size) of records in memory, oldest first
+        self.resident=deque()
+        self.residentsize=0
+
+        # temporary file, created when the first record is spilled
+        self.fh=None
+        self.spillend=0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self.records)))]
+        e=self.records[i]
+        if e is None:
+            if i<0:
+                i+=len(self.records)
+            if self.fh is None:
+                raise ValueError("The spill file of this EMF has been closed")
+            self.fh.seek(self.offsets[i])
+            e=emr.fromBuffer(self.fh.read(self.sizes[i]),0,self.compact)
+            self.records[i]=e
+            self._keep(i,self.sizes[i])
+        return e
+
+    def __setitem__(self,i,e):
+        if i<0:
+            i+=len(self.records)
+        spilled=self.records[i] is None
+        self.records[i]=e
+        self.offsets[i]=-1
+        if spilled:
+            self._keep(i,e.calcSize())
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def append(self,e):
+        i=len(self.records)
+        self.records.append(e)
+        self.offsets.append(-1)
+        self.sizes.append(0)
+        if i>0:
+            self._keep(i,e.calcSize())
+
+    def extend(self,records):
+        for e in records:
+            self.append(e)
+
+    def _keep(self,i,size):
+        self.resident.append((i,size))
+        self.residentsize+=size
+        while self.residentsize>self.limit and len(self.resident)>1:
+            (j,size)=self.resident.popleft()
+            self.residentsize-=size
+            self.spill(j)
+
+    def spill(self,i):
+        """Write record i to the spill file, unless the bytes already
+        there are still current, and drop it from memory."""
+        e=self.records[i]
+        if e is None:
+            return
+        if self.offsets[i]<0 or e.isModified():
+            if self.fh is None:
+                self.fh=tempfile.TemporaryFile()
+            data=e.pack()
+            self.fh.seek(self.spillend)
+            self.fh.write(data)
+            self.offsets[i]=self.spillend
+            self.sizes[i]=len(data)
+            self.spillend+=len(data)
+        self.records[i]=None
+
+    def isSpilled(self,i):
+        """Return True if record i is only in the spill file."""
+        return self.records[i] is None
+
+    def packedSize(self,start=0):
+        """Return the total size of the records from start onwards when
+        packed."""
+        size=0
+        for i in range(start,len(self.records)):
+            e=self.records[i]
+            if e is None:
+                size+=self.sizes[i]
+            else:
+                size+=e.calcSize()
+        return size
+
+    def iterSaved(self,chunksize=1<<20):
+        """Iterate over the records for saving.  Spilled records are
+        returned as memoryviews of their packed bytes, which are read
+        from the spill file in runs of up to about chunksize bytes."""
+        i=0
+        count=len(self.records)
+        while i<count:
+            if self.records[i] is not None:
+                yield self.records[i]
+                i+=1
+                continue
+            # read the run of spilled records that follow each other
+            # in the spill file in one go
+            start=self.offsets[i]
+            end=i+1
+            while (end<count and self.records[end] is None
+                   and self.offsets[end]==self.offsets[end-1]+self.sizes[end-1]
+                   and self.offsets[end]+self.sizes[end]-start<=chunksize):
+                end+=1
+            self.fh.seek(start)
+            view=memoryview(self.fh.read(self.offsets[end-1]+self.sizes[end-1]-start))
+            for j in range(i,end):
+                ptr=self.offsets[j]-start
+                yield view[ptr:ptr+self.sizes[j]]
+            i=end
+
+    def close(self):
+        """Delete the spill file."""
+        if self.fh is not None:
+            self.fh.close()
+            self.fh=None
+
+# struct format characters that can be stored in an array
+_numericcodes="bBhHiIlLqQfd"
+
+def _items(typecode,values,count=None):
+    """Return values as an array of the given typecode, checking that
+    there are count of them if count is given."""
+    items=array(typecode,values)
+    if count is not None and len(items)!=count:
+        raise ValueError("expected %d items, got %d" % (count,len(items)))
+    return items
+
+class _ColumnGroup:
+    """The columns holding the fields of every record of one class in a
+    L{ColumnarRecordList}, one row per record.  Fixed size numeric
+    fields are stored in an array each, with as many items per row as
+    the field has numbers.  Variable length numeric lists and points
+    are stored one after the other in a flat array, with arrays of the
+    start and the number of items of each row.  Any other field is kept
+    in a list."""
+
+    def __init__(self,cls,compact,number):
+        self.cls=cls
+        self.compact=compact
+        self.number=number
+
+        # position of each row in the record list, or -1 if the record
+        # has since been replaced
+        self.positions=array('q')
+        self.nsizes=array('i')
+        # unhandleddata of the rows that have any
+        self.extra={}
+
+        # field name -> array, for fixed size numeric fields
+        self.columns={}
+        # field name -> (flat array of items, start, count), for
+        # variable length numeric fields
+        self.varcolumns={}
+        # field name -> list, for everything else
+        self.objects={}
+
+        # (field name, function appending a value as a new row)
+        self.adders=[]
+        # functions dropping any rows from the given one onwards
+        self.truncaters=[]
+
+        props={}
+        for name in cls.format.names:
+            props[_slotName(name)]=self._addField(name,cls.format.fmtmap[name])
+        self.viewclass=self._makeViewClass(props)
+
+    def _addField(self,name,fmtobj):
+        """Create the column for a field, and return the property that
+        reads and writes it for a view."""
+        code=fmtobj.getStructFormat()
+        fmt=(fmtobj.fmt or '').lstrip("<>@!=")
+        if code and len(set(code))==1 and code[0] in _numericcodes:
+            return self._addFixed(name,fmtobj,_arraycode(code[0]),len(code))
+        elif (isinstance(fmtobj,(List,Tuples)) and not fmtobj.isFixed()
+              and fmt and len(set(fmt))==1 and fmt[0] in _numericcodes):
+            return self._addVariable(name,fmtobj,_arraycode(fmt[0]))
+        return self._addObject(name)
+
+    def _addFixed(self,name,fmtobj,typecode,stride):
+        col=array(typecode)
+        self.columns[name]=col
+        if isinstance(fmtobj,StructFormat):
+            def get(view):
+                return col[view.row]
+            def set(view,value):
+                col[view.row]=value
+            add=col.append
+        else:
+            def get(view):
+                start=view.row*stride
+                return fmtobj.fromStruct(col[start:start+stride])
+            def set(view,value):
+                start=view.row*stride
+                col[start:start+stride]=_items(typecode,fmtobj.toStruct(value),stride)
+            def add(value):
+                col.extend(_items(typecode,fmtobj.toStruct(value),stride))
+        def truncate(row):
+            del col[row*stride:]
+        self.adders.append((name,add))
+        self.truncaters.append(truncate)
+        return property(get,set)
+
+    def _addVariable(self,name,fmtobj,typecode):
+        flat=array(typecode)
+        starts=array('q')
+        counts=array('q')
+        self.varcolumns[name]=(flat,starts,counts)
+        rank=getattr(fmtobj,'rank',None)
+        compact=self.compact
+        def get(view):
+            row=view.row
+            start=starts[row]
+            items=flat[start:start+counts[row]]
+            if not compact:
+                return fmtobj.fromStruct(items)
+            elif rank is None:
+                return items
+            return PointArray(items,rank)
+        def set(view,value):
+            row=view.row
+            items=_items(typecode,fmtobj.toStruct(value))
+            count=len(items)
+            if count<=counts[row]:
+                # reuse the space of the old value
+                start=starts[row]
+                flat[start:start+count]=items
+            else:
+                starts[row]=len(flat)
+                flat.extend(items)
+            counts[row]=count
+        def add(value):
+            items=_items(typecode,fmtobj.toStruct(value))
+            starts.append(len(flat))
+            flat.extend(items)
+            counts.append(len(items))
+        def truncate(row):
+            if len(starts)>row:
+                del flat[starts[row]:]
+                del starts[row:]
+                del counts[row:]
+        self.adders.append((name,add))
+        self.truncaters.append(truncate)
+        return property(get,set)
+
+    def _addObject(self,name):
+        col=[]
+        self.objects[name]=col
+        def get(view):
+            return col[view.row]
+        def set(view,value):
+            col[view.row]=value
+        def truncate(row):
+            del col[row:]
+        self.adders.append((name,col.append))
+        self.truncaters.append(truncate)
+        return property(get,set)
+
+    def _makeViewClass(self,props):
+        """Create the subclass of the record class whose instances read
+        and write their fields in the columns of this group.  The slots
+        the record class keeps its fields in are replaced by properties,
+        so the methods of the record class work on a view unchanged."""
+        cls=self.cls
+        nsizes=self.nsizes
+        extra=self.extra
+
+        def getType(view):
+            return cls.emr_id
+        def setType(view,value):
+            if value!=cls.emr_id:
+                raise ValueError("the type of a record in a ColumnarRecordList can't be changed")
+        def getSize(view):
+            return nsizes[view.row]
+        def setSize(view,value):
+            nsizes[view.row]=value
+        def getExtra(view):
+            return extra.get(view.row)
+        def setExtra(view,value):
+            if value:
+                extra[view.row]=value
+            else:
+                extra.pop(view.row,None)
+        def getData(view):
+            return None
+        def setData(view,value):
+            pass
+
+        ns=dict(props)
+        ns.update({
+            '__slots__':('row',),
+            '__module__':cls.__module__,
+            '__doc__':cls.__doc__,
+            'columngroup':self,
+            '_iType':property(getType,setType),
+            '_nSize':property(getSize,setSize),
+            '_unhandleddata':property(getExtra,setExtra),
+            # a view is always packed from its columns
+            'data':property(getData,setData),
+            'verbose':False,
+            'datasize':0,
+            'error':0,
+            'detach':_detachView,
+            '__reduce_ex__':_reduceView,
+            })
+        return type(cls)(cls.__name__,(cls,),ns)
+
+    def view(self,row):
+        view=self.viewclass.__new__(self.viewclass)
+        view.row=row
+        return view
+
+    def add(self,e,position):
+        """Append the fields of record e as a new row, and return its
+        number, or -1 if one of the values doesn't fit its column."""
+        row=len(self.positions)
+        try:
+            for name,add in self.adders:
+                add(getattr(e,name))
+            self.nsizes.append(e.nSize)
+        except (TypeError,ValueError,OverflowError,AttributeError):
+            for truncate in self.truncaters:
+                truncate(row)
+            del self.nsizes[row:]
+            return -1
+        extra=e.unhandleddata
+        if extra:
+            if isinstance(extra,memoryview):
+                # don't keep the whole buffer the record was read from
+                extra=bytes(extra)
+            self.extra[row]=extra
+        self.positions.append(position)
+        return row
+
+def _detachView(view):
+    """Return a copy of the record that is independent of the
+    L{ColumnarRecordList} it is a view of."""
+    cls=view.columngroup.cls
+    e=cls.__new__(cls)
+    e.data=None
+    for name in cls.format.names:
+        setattr(e,_slotName(name),getattr(view,name))
+    e._iType=view.iType
+    e._nSize=view.nSize
+    e._unhandleddata=view.unhandleddata
+    e.verbose=view.verbose
+    e.datasize=view.datasize
+    e.error=view.error
+    for name,value in view.__dict__.items():
+        setattr(e,name,value)
+    return e
+
+def _newRecord(cls,*args):
+    return cls.__new__(cls,*args)
+
+def _reduceView(view,protocol):
+    # views are pickled and copied as the records they refer to.
+    # Pickle insists that copyreg.__newobj__ creates an object of the
+    # class being pickled, so that is done by _newRecord instead.
+    reduced=view.detach().__reduce_ex__(protocol)
+    if reduced[0] is copyreg.__newobj__:
+        reduced=(_newRecord,)+reduced[1:]
+    return reduced
+
+class ColumnarRecordList:
+    """
+List-like container of EMR records that stores the fields of the
+records rather than the record objects.  Records are grouped by class,
+and each group keeps the values of each field of all its records in a
+single column: an array for numeric fields, with variable length lists
+and points like C{aptl} and C{dx} stored one after the other in a flat
+array indexed by arrays of starts and counts.  Two arrays give the
+group and row of each record in order.
+
+Accessing a record returns a view, an instance of a subclass of the
+record class that reads and writes its fields in the columns.  Values
+read from a view are copies, so changes made in place, like
+C{e.aptl[0][0]=10}, are lost; assign the field instead.  Views are
+always packed from the columns when saved.  Use L{detach} on a view to
+get an ordinary record.
+
+The columns of a type can be scanned or changed in bulk without
+creating any views, see L{column} and L{indices}::
+
+    xs=records.column(emr.LINETO.emr_id,'ptl_x')
+    for i in range(len(xs)):
+        xs[i]+=100
+
+Records that can't be stored in columns are kept as objects: the
+header, records of unregistered types or that weren't decoded,
+records with attributes outside their fields, and records with a
+value that doesn't fit its column.  The newest record is also kept as
+an object until the next one is appended, as the caller may still
+fill in its handle.
+    """
+
+    def __init__(self,compact=False):
+        self.compact=compact
+
+        # _ColumnGroup for each record class, and the classes that
+        # can't be stored in columns
+        self.groups=[]
+        self.byclass={}
+        self.bytype={}
+
+        # group number of each record, or -1 for records kept as
+        # objects, and the row in the group or the index in objects
+        self.kinds=array('i')
+        self.rows=array('q')
+        self.objects=[]
+
+        # newest record, not yet stored
+        self.pending=None
+
+    def __len__(self):
+        return len(self.kinds)+(self.pending is not None)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        count=len(self.kinds)
+        if i<0:
+            i+=len(self)
+        if i==count and self.pending is not None:
+            return self.pending
+        if i<0 or i>=count:
+            raise IndexError("record index out of range")
+        kind=self.kinds[i]
+        if kind<0:
+            return self.objects[self.rows[i]]
+        return self.groups[kind].view(self.rows[i])
+
+    def __setitem__(self,i,e):
+        count=len(self.kinds)
+        if i<0:
+            i+=len(self)
+        if i==count and self.pending is not None:
+            self.pending=e
+            return
+        if i<0 or i>=count:
+            raise IndexError("record index out of range")
+        kind=self.kinds[i]
+        if kind<0:
+            self.objects[self.rows[i]]=None
+        else:
+            self.groups[kind].positions[self.rows[i]]=-1
+        (self.kinds[i],self.rows[i])=self._add(e,i)
+
+    def __iter__(self):
+        groups=self.groups
+        objects=self.objects
+        for kind,row in zip(self.kinds,self.rows):
+            if kind<0:
+                yield objects[row]
+            else:
+                yield groups[kind].view(row)
+        if self.pending is not None:
+            yield self.pending
+
+    def append(self,e):
+        self.flush()
+        self.pending=e
+
+    def extend(self,records):
+        for e in records:
+            self.append(e)
+
+    def flush(self):
+        """Store the newest record in the columns."""
+        if self.pending is not None:
+            (kind,row)=self._add(self.pending,len(self.kinds))
+            self.kinds.append(kind)
+            self.rows.append(row)
+            self.pending=None
+
+    def _group(self,e):
+        """Return the group to store record e in, or None if it has to
+        be kept as an object."""
+        group=getattr(type(e),'columngroup',None)
+        if group is not None:
+            cls=group.cls
+        else:
+            cls=type(e)
+            if e.__dict__ or e.verbose:
+                return None
+        if cls in self.byclass:
+            group=self.byclass[cls]
+        else:
+            group=None
+            if emr.emrmap.get(cls.emr_id) is cls and cls is not emr.HEADER:
+                group=_ColumnGroup(cls,self.compact,len(self.groups))
+                self.groups.append(group)
+                self.bytype[cls.emr_id]=group
+            self.byclass[cls]=group
+        if group is not None and e.iType!=cls.emr_id:
+            return None
+        return group
+
+    def _add(self,e,position):
+        """Store record e, returning its group number and row."""
+        group=self._group(e)
+        if group is not None:
+            row=group.add(e,position)
+            if row>=0:
+                return (group.number,row)
+        self.objects.append(e)
+        return (-1,len(self.objects)-1)
+
+    def _typeGroup(self,iType):
+        self.flush()
+        if iType not in self.bytype:
+            raise KeyError("no records of type %d are stored in columns" % iType)
+        return self.bytype[iType]
+
+    def types(self):
+        """Return the record types that are stored in columns."""
+        self.flush()
+        return list(self.bytype)
+
+    def column(self,iType,name):
+        """
+Return the column holding a field of the records of the given type,
+one row per record in the order of L{indices}.  Changes made to the
+column change the records.  For a fixed size numeric field, the column
+is an array with one item per row, or several for a field like
+C{rclBounds} (four) or C{ptl} (two).  For a variable length numeric
+field, it is a tuple of a flat array holding the items of all the
+rows, and arrays of the start and number of items of each row.  Any
+other field is a list of values.
+
+The arrays can be wrapped with C{numpy.frombuffer} for vectorized
+changes, but no records of the type can be added while that is done.
+
+@param iType: record type
+@type iType: int
+@param name: name of the field
+@type name: string
+@raise KeyError: if there are no records of that type in columns, or
+the field doesn't exist
+        """
+        group=self._typeGroup(iType)
+        for columns in (group.columns,group.varcolumns,group.objects):
+            if name in columns:
+                return columns[name]
+        raise KeyError("record type %d has no field %s" % (iType,name))
+
+    def indices(self,iType):
+        """
+Return the position in the list of the record of each row of the
+columns of the given type, or -1 for a row whose record has been
+replaced.
+
+@param iType: record type
+@type iType: int
+@rtype: array
+        """
+        return self._typeGroup(iType).positions
+
+    def isColumnar(self,i):
+        """Return True if record i is stored in columns."""
+        if i<0:
+            i+=len(self)
+        return i<len(self.kinds) and self.kinds[i]>=0
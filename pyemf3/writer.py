@@ -0,0 +1,293 @@
+import os
+import shutil
+import struct
+import tempfile
+
+from . import emr
+from . import emz
+from .emf import EMF, probe
+from .index import RecordIndex
+
+def _findEOF(fh,filesize,header):
+    """Return the offset and the bytes of the EOF record at the end of
+    an EMF file.  The EOF is found from its nSizeLast field, or by
+    trying the usual 20 and 12 byte sizes, and only if none of those
+    fit are the record prefixes of the whole file walked."""
+    fh.seek(filesize-4)
+    (last,)=struct.unpack("<I",fh.read(4))
+    for size in (last,20,12):
+        offset=filesize-size
+        if size<12 or offset<header.nSize:
+            continue
+        fh.seek(offset)
+        data=fh.read(size)
+        (iType,nSize)=struct.unpack_from("<ii",data)
+        if iType==emr.EOF.emr_id and nSize==size:
+            return (offset,data)
+    index=RecordIndex()
+    fh.seek(0)
+    index.scan(fh)
+    if len(index)<2 or index.types[-1]!=emr.EOF.emr_id:
+        raise ValueError("EMF file doesn't end with an EOF record")
+    offset=index.offsets[-1]
+    fh.seek(offset)
+    return (offset,fh.read(filesize-offset))
+
+class EMFStreamWriter(EMF):
+    """
+An L{EMF} that writes each record to the output as it is drawn, rather
+than keeping all the records until L{save}.  Only the objects in the
+handle table and the newest record are kept in memory, so very large
+metafiles can be generated in constant memory.  The bounds of a path
+are merged from its records as they are written out.
+
+A placeholder header is written first and is filled in with the size,
+number of records, number of handles and bounds by L{close}.  If the
+output can't seek, e.g. a pipe or a socket, the records are spooled
+to a temporary file and copied to the output after the header on
+close.  The same happens when writing a gzip compressed EMZ file,
+which is chosen by compress, or by a filename ending in C{.emz}; the
+header and the spooled records are compressed as they are copied.
+
+The drawing methods are the same as for L{EMF}.  The records list
+only holds the records that haven't been written yet::
+
+    with EMFStreamWriter("map.emf",8.5,11,300) as emf:
+        for x,y in segments:
+            emf.LineTo(x,y)
+
+With append=True, output must be an existing uncompressed EMF file
+(see L{EMF.open_append<emf.EMF.open_append>}).  Only its header and
+EOF record are read, the EOF is cut off, and new records are written
+after the existing ones.  The size and description of the image come
+from the existing header.  Handles used by the existing records are
+all treated as still allocated, so new objects get handles above
+them.
+    """
+
+    def __init__(self,output,width=6.0,height=4.0,density=300,units="in",
+                 description="pyemf.sf.net",verbose=False,compress=None,level=9,
+                 append=False):
+        """
+@param output: filename or binary file object to write to
+@type output: string or file
+@param width: width of EMF image in inches or millimeters
+@param height: height of EMF image in inches or millimeters
+@param density: dots (pixels) per unit measurement
+@param units: string indicating the unit measurement, 'in' or 'mm'
+@param description: optional string to specify a description of the image
+@type description: string
+@param compress: write gzip compressed EMZ
+@type compress: Boolean
+@param level: zlib compression level for EMZ
+@type level: int
+@param append: add records to the end of the existing EMF in output
+@type append: Boolean
+        """
+        self.filename=None
+        self.header=None
+        self.eof=None
+        self.nrecords=0
+        self.nbytes=0
+        # bounds of the records written since the last BEGINPATH
+        self.pathbounds=None
+        self.closed=False
+        name=None
+        if isinstance(output,(str,bytes,os.PathLike)):
+            name=output
+        if append:
+            self.output=open(name,'r+b') if name is not None else output
+            try:
+                self._openAppend()
+            except:
+                if name is not None:
+                    self.output.close()
+                raise
+        else:
+            if name is not None:
+                if compress is None:
+                    compress=emz.isEMZName(name)
+                output=open(name,'wb')
+            self._openOutput(output,compress,level)
+
+        EMF.__init__(self,width,height,density,units,description,verbose)
+        if append:
+            self._resumeAppend()
+        if name is not None:
+            self.filename=name
+
+    def _openOutput(self,output,compress,level):
+        self.output=output
+        self.compressed=None
+        if compress:
+            # the header can't be back-patched in a compressed stream
+            self.compressed=emz.openOutput(self.output,level)
+            seekable=False
+        else:
+            try:
+                seekable=self.output.seekable()
+            except AttributeError:
+                seekable=False
+        if seekable:
+            self.fh=self.output
+            self.headerpos=self.fh.tell()
+        else:
+            self.fh=tempfile.TemporaryFile()
+            self.headerpos=None
+
+    def _openAppend(self):
+        """Read the header and the EOF record of the existing file, and
+        cut off the EOF so that new records are written in its place."""
+        fh=self.fh=self.output
+        self.compressed=None
+        fh.seek(0)
+        if emz.isCompressed(fh.read(2)):
+            raise ValueError("Can't append to a compressed EMF file")
+        fh.seek(0)
+        self.header=probe(fh)
+        self.headerpos=0
+        filesize=fh.seek(0,os.SEEK_END)
+        (offset,data)=_findEOF(fh,filesize,self.header)
+        self.eof=emr.fromBuffer(data)
+        self.nrecords=self.header.nRecords-1
+        self.nbytes=offset
+        fh.seek(offset)
+        fh.truncate()
+
+    def _resumeAppend(self):
+        """Set up the device context from the existing header, in place
+        of the one for a new image made by L{EMF.__init__}."""
+        header=self.header
+        self.dc.getBounds(header)
+        self.scaleheader=False
+        # the existing records may still use any of these handles, so
+        # fill them with something other than None
+        self.dc.objects=[None]+[header]*(header.nHandles-1)
+        self.dc.objectholes=[]
+
+    def _append(self,e):
+        """Write out the records appended so far and hold on to this
+        one, as the caller may still fill in its handle."""
+        if self.closed:
+            raise ValueError("EMF stream already closed")
+        if e.error:
+            return 0
+        if isinstance(e,emr.HEADER):
+            if self.header is not None:
+                # already read from the file being appended to
+                return 1
+            # write a placeholder until the real values are known
+            self.header=e
+            data=e.pack()
+            if self.headerpos is not None:
+                self.fh.write(data)
+            self.nrecords=1
+            self.nbytes=len(data)
+            return 1
+        if self.verbose:
+            print("Appending: ", end=' ')
+            print(e)
+        self._flush()
+        if isinstance(e,emr.BEGINPATH):
+            self.pathbounds=None
+        self.records.append(e)
+        return 1
+
+    def _flush(self):
+        for e in self.records:
+            self.pathbounds=self._addBounds(self.pathbounds,e)
+            data=e.pack()
+            self.fh.write(data)
+            self.nbytes+=len(data)
+            self.nrecords+=1
+        del self.records[:]
+
+    def _addBounds(self,bounds,e):
+        """Merge the bounds of record e into bounds, which is None if
+        no record has had any bounds yet."""
+        itembounds=e.getBounds()
+        if bounds is None:
+            if itembounds:
+                bounds=[[itembounds[0][0],itembounds[0][1]],
+                        [itembounds[1][0],itembounds[1][1]]]
+            return bounds
+        self._mergeBounds(bounds,itembounds)
+        return bounds
+
+    def _getPathBounds(self):
+        """Get the bounding rectangle of the records from the last
+        BEGINPATH to the current record, like L{EMF._getPathBounds},
+        from the bounds of the records already written and those
+        still held."""
+        bounds=None
+        if self.pathbounds is not None:
+            bounds=[list(self.pathbounds[0]),list(self.pathbounds[1])]
+        for e in self.records:
+            bounds=self._addBounds(bounds,e)
+        if bounds is None:
+            bounds=[[0,0],[-1,-1]]
+        return bounds
+
+    def close(self):
+        """Write the EOF record and the final header.  The output is
+        closed if it was opened from a filename."""
+        if self.closed:
+            return
+        if self.eof is None:
+            self.eof=emr.EOF()
+        self._append(self.eof)
+        self._flush()
+        self.closed=True
+
+        header=self.header
+        size=header.nSize
+        header.setBounds(self.dc,self.scaleheader)
+        header.nRecords=self.nrecords
+        header.nHandles=len(self.dc.objects)
+        header.nBytes=self.nbytes
+        data=header.pack()
+        if len(data)!=size:
+            raise ValueError("EMF header changed size while streaming")
+
+        if self.headerpos is not None:
+            end=self.fh.tell()
+            self.fh.seek(self.headerpos)
+            self.fh.write(data)
+            self.fh.seek(end)
+        else:
+            out=self.output
+            if self.compressed is not None:
+                out=self.compressed
+            out.write(data)
+            self.fh.seek(0)
+            shutil.copyfileobj(self.fh,out)
+            self.fh.close()
+            if self.compressed is not None:
+                # writes the gzip trailer, leaving the output open
+                self.compressed.close()
+        self.output.flush()
+        if self.filename is not None:
+            self.output.close()
+
+    def save(self,filename=None):
+        """Same as L{close}.  The output is given when the writer is
+        created, so filename must be None."""
+        if filename is not None:
+            raise ValueError("EMFStreamWriter output can't be changed when saving")
+        self.close()
+        return True
+
+    def _notStreamed(self,*args,**kwargs):
+        """The methods of L{EMF} that return the whole file can't be
+        used, as the records have already been written out."""
+        raise ValueError("EMFStreamWriter writes its records to the output as they are drawn, so the whole file isn't available")
+
+    tobytes=_notStreamed
+    serialize_into=_notStreamed
+    iter_chunks=_notStreamed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exctype,exc,tb):
+        self.close()
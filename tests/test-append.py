@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Test of adding records to an existing file, with EMF.open_append and
+# by saving an EMF again after drawing more, which only writes the new
+# records: the file must be the same as one saved in one go
+
+import os
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+def drawStart(emf):
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,1000,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+
+def drawMore(emf,y):
+    pen=emf.CreatePen(pyemf.PS_SOLID,5,(0xff,0,0))
+    emf.SelectObject(pen)
+    emf.Polyline([(100,y),(1000,y+500),(3000,y)])
+
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+drawMore(emf,200)
+drawMore(emf,2500)
+ret=emf.save("test-append.emf")
+print("save returns %s" % str(ret))
+expected=open("test-append.emf","rb").read()
+
+# appending to the file twice
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-append-open.emf")
+for y in (200,2500):
+    with pyemf.EMF.open_append("test-append-open.emf") as appended:
+        drawMore(appended,y)
+
+loaded=pyemf.EMF()
+loaded.load("test-append-open.emf")
+header=loaded.records[0]
+assert header.nRecords==len(loaded.records)
+assert header.nBytes==os.path.getsize("test-append-open.emf")
+assert header.nHandles==len(loaded.dc.objects)==4
+assert open("test-append-open.emf","rb").read()==expected
+
+# saving again after drawing more only writes the new records
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-append-resave.emf")
+drawMore(emf,200)
+emf.save("test-append-resave.emf")
+drawMore(emf,2500)
+emf.save("test-append-resave.emf")
+assert open("test-append-resave.emf","rb").read()==expected
+
+# a record saved before that has changed since means writing the
+# whole file again
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+drawMore(emf,200)
+emf.save("test-append-changed.emf")
+emf.records[3].ptl_x=150
+drawMore(emf,2500)
+emf.save("test-append-changed.emf")
+reference=pyemf.EMF(width,height,dpi)
+drawStart(reference)
+drawMore(reference,200)
+reference.records[3].ptl_x=150
+drawMore(reference,2500)
+assert open("test-append-changed.emf","rb").read()==reference.tobytes()
+
+# so does a file that has been changed by something else
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-append-replaced.emf")
+open("test-append-replaced.emf","wb").write(b"\0"*10)
+drawMore(emf,200)
+drawMore(emf,2500)
+emf.save("test-append-replaced.emf")
+assert open("test-append-replaced.emf","rb").read()==expected
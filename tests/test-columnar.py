@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Test of storing the records in columns: changes made through views,
+# columns and replaced records must give the same file as the same
+# changes made to ordinary records
+
+import copy
+import pickle
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def draw(emf):
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,2000,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+    emf.Polyline([(100,100),(1000,1500),(2000,100)])
+    emf.Polyline([(100,200),(1000,1600),(2000,200),(2500,300)])
+    emf.TextOut(100,200,"columns")
+    emf.DeleteObject(pen)
+    return emf
+
+emf=draw(pyemf.EMF(width,height,dpi))
+ret=emf.save("test-columnar.emf")
+print("save returns %s" % str(ret))
+expected=open("test-columnar.emf","rb").read()
+
+drawn=draw(pyemf.EMF(width,height,dpi,columnar=True))
+assert drawn.records.isColumnar(3)
+drawn.save("test-columnar-drawn.emf")
+assert open("test-columnar-drawn.emf","rb").read()==expected
+
+loaded=pyemf.EMF(columnar=True)
+loaded.load("test-columnar.emf")
+assert not loaded.records.isColumnar(0)
+assert loaded.records.isColumnar(3)
+eager=pyemf.EMF()
+eager.load("test-columnar.emf")
+assert len(loaded.records)==len(eager.records)
+for i in range(len(eager.records)):
+    assert str(loaded.records[i])==str(eager.records[i])
+# records decoded by worker processes are stored in columns too
+parallel=pyemf.EMF(columnar=True)
+parallel.load("test-columnar.emf",workers=2)
+assert parallel.records.isColumnar(3)
+assert parallel.tobytes()==expected
+
+lines=[i for i in range(len(emf.records)) if emf.records[i].iType==emr.LINETO.emr_id]
+polys=[i for i in range(len(emf.records)) if emf.records[i].iType==emr.POLYLINE16.emr_id]
+assert list(loaded.records.indices(emr.LINETO.emr_id))==lines
+assert len(polys)==2
+
+# changing a column changes the records
+xs=loaded.records.column(emr.LINETO.emr_id,'ptl_x')
+for row in range(len(xs)):
+    xs[row]+=100
+for i in lines:
+    emf.records[i].ptl_x+=100
+assert loaded.records[lines[2]].ptl_x==emf.records[lines[2]].ptl_x
+
+# fields set through views, including lists of points that shrink and
+# grow
+loaded.records[4].ptl_y=1507
+emf.records[4].ptl_y=1507
+loaded.records[polys[0]].aptl=[(10,20),(30,40)]
+emf.records[polys[0]].aptl=[(10,20),(30,40)]
+loaded.records[polys[1]].aptl=[(1,2),(3,4),(5,6),(7,8),(9,10),(11,12)]
+emf.records[polys[1]].aptl=[(1,2),(3,4),(5,6),(7,8),(9,10),(11,12)]
+assert [tuple(p) for p in loaded.records[polys[1]].aptl]==emf.records[polys[1]].aptl
+
+# replacing a record leaves its old row unused
+loaded.records[lines[0]]=emr.MOVETOEX(42,43)
+emf.records[lines[0]]=emr.MOVETOEX(42,43)
+assert loaded.records.indices(emr.LINETO.emr_id)[0]==-1
+assert loaded.records[lines[0]].ptl_x==42
+
+loaded.save("test-columnar-edited.emf")
+assert open("test-columnar-edited.emf","rb").read()==emf.tobytes()
+
+# views are pickled and copied as ordinary records
+view=loaded.records[lines[1]]
+for record in (pickle.loads(pickle.dumps(view)),copy.deepcopy(view),view.detach()):
+    assert type(record) is emr.LINETO
+    assert record.pack()==emf.records[lines[1]].pack()
+    record.ptl_x=-1
+    assert view.ptl_x==emf.records[lines[1]].ptl_x
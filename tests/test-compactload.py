@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+# Test of loading point lists into compact arrays
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+
+# 16 bit and 32 bit points
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.Polyline([(100,100),(100000,1500),(2000,100)])
+
+polylist=[]
+for y in range(200,1500,200):
+    polylist.append([(100,y),(1000,y+100),(2000,y)])
+emf.PolyPolyline(polylist)
+
+font=emf.CreateFont(50,name="Arial")
+emf.SelectObject(font)
+emf.TextOut(100,1700,"compact")
+
+ret=emf.save("test-compactload.emf")
+print("save returns %s" % str(ret))
+
+def normalize(value):
+    if isinstance(value,(int,float,str)):
+        return value
+    return [tuple(item) if isinstance(item,(list,tuple)) else item for item in value]
+
+eager=pyemf.EMF()
+eager.load("test-compactload.emf")
+compact=pyemf.EMF()
+compact.load("test-compactload.emf",compact=True)
+assert len(compact.records)==len(eager.records)
+for i in range(len(eager.records)):
+    for name in eager.records[i].format.names:
+        assert normalize(getattr(compact.records[i],name))==normalize(getattr(eager.records[i],name))
+assert compact.records[3].aptl[1]==(1000,1500)
@@ -38,3 +38,12 @@ for i in range(16):
 
 ret=emf.save("test-deleteobject.emf")
 print("save returns %s" % str(ret))
+
+# the handles of deleted objects are reused by the file, so once it is
+# loaded there are no free handles left, and a new object gets a new
+# handle rather than one that is in use
+loaded=pyemf.EMF()
+loaded.load("test-deleteobject.emf")
+count=len(loaded.dc.objects)
+assert None not in loaded.dc.objects[1:]
+assert loaded.CreatePen(pyemf.PS_SOLID,1,(0,0,0))==count
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+# Test of writing gzip compressed EMZ files, including in parallel
+# blocks with threads: the result must be a valid gzip file holding
+# exactly the EMF bytes
+
+import gzip
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.TextOut(100,1700,"compressed")
+
+ret=emf.save("test-emz.emf")
+print("save returns %s" % str(ret))
+
+def check(emf,filename,threads,level=9):
+    emf.save(filename,threads=threads,level=level)
+    # gzip checks the CRC and length in the trailer
+    data=gzip.decompress(open(filename,"rb").read())
+    assert data==emf.tobytes()
+    loaded=pyemf.EMF()
+    loaded.load(filename)
+    assert loaded.tobytes()==data
+    return data
+
+# a file smaller than one compression block
+for threads in (None,1,2):
+    check(emf,"test-emz.emz",threads)
+
+# a file of several blocks, compressed by a pool of threads
+big=pyemf.EMF(width,height,dpi)
+for i in range(200000):
+    big.LineTo(i%2000,i%1500)
+data=check(big,"test-emz-big.emz",4)
+assert len(data)>3*(1<<20)
+check(big,"test-emz-big.emz",3,level=1)
+assert check(big,"test-emz-big.emz",None)==data
+
+# EMZ files written on Windows are often padded with zero bytes after
+# the gzip data, which readers must skip like gzip does, whether the
+# file is loaded or fed to a parser in small pieces
+data=emf.tobytes()
+padded=gzip.compress(data)+b"\0"*13
+open("test-emz-padded.emz","wb").write(padded)
+for lazy in (False,True):
+    loaded=pyemf.EMF()
+    loaded.load("test-emz-padded.emz",lazy=lazy)
+    assert loaded.tobytes()==data
+loaded=pyemf.EMF()
+loaded.loadmem(padded)
+assert loaded.tobytes()==data
+members=gzip.compress(data[:100])+b"\0"*5+gzip.compress(data[100:])+b"\0"*512
+for stream in (padded,members):
+    for chunksize in (1,4,len(stream)):
+        parser=pyemf.EMFParser()
+        records=[]
+        for i in range(0,len(stream),chunksize):
+            parser.feed(stream[i:i+chunksize])
+            records.extend(parser)
+        parser.close()
+        records.extend(parser)
+        assert b"".join(e.pack() for e in records)==data
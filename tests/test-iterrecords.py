@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Test of reading records one at a time with iter_records: the records
+# and the handle table must be the same as those of an ordinary load
+
+import gzip
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,2000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+font=emf.CreateFont(50,name="Arial")
+emf.SelectObject(font)
+emf.TextOut(100,1700,"iterated")
+emf.DeleteObject(pen)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+
+ret=emf.save("test-iterrecords.emf")
+print("save returns %s" % str(ret))
+
+loaded=pyemf.EMF()
+loaded.load("test-iterrecords.emf")
+expected=[e.pack() for e in loaded.records]
+
+# the handle table is kept up to date as the records are read
+dc=pyemf.EMF().dc
+selected=[]
+records=[]
+for e in pyemf.iter_records("test-iterrecords.emf",dc):
+    records.append(e.pack())
+    if isinstance(e,emr.SELECTOBJECT):
+        selected.append(type(dc.objects[e.handle]))
+assert records==expected
+assert selected[:2]==[emr.CREATEPEN,emr.EXTCREATEFONTINDIRECTW]
+assert len(dc.objects)==len(loaded.dc.objects)
+assert dc.objects[1] is None and dc.objectholes==loaded.dc.objectholes
+
+# from a file object, which is left open, and from an EMZ file
+fh=open("test-iterrecords.emf","rb")
+assert [e.pack() for e in pyemf.iter_records(fh)]==expected
+assert not fh.closed
+fh.close()
+with gzip.GzipFile("test-iterrecords.emz","wb",mtime=0) as out:
+    out.write(open("test-iterrecords.emf","rb").read())
+assert [e.pack() for e in pyemf.iter_records("test-iterrecords.emz")]==expected
+
+# only the records of the given types are decoded
+records=list(pyemf.iter_records("test-iterrecords.emf",decode={emr.LINETO.emr_id}))
+assert [e.pack() for e in records]==expected
+assert all(isinstance(e,emr.RAW) for e in records if type(e) not in
+           (emr.HEADER,emr.EOF,emr.LINETO,emr.CREATEPEN,emr.EXTCREATEFONTINDIRECTW,emr.DELETEOBJECT))
+assert records[4].ptl_x==100
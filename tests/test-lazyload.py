@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+# Test of lazy loading: records are only decoded when accessed
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,2000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.DeleteObject(pen)
+
+ret=emf.save("test-lazyload.emf")
+print("save returns %s" % str(ret))
+
+eager=pyemf.EMF()
+eager.load("test-lazyload.emf")
+lazy=pyemf.EMF()
+lazy.load("test-lazyload.emf",lazy=True)
+assert len(lazy.records)==len(eager.records)
+assert not lazy.records.isLoaded(3)
+assert len(lazy.dc.objects)==len(eager.dc.objects)
+for i in range(len(eager.records)):
+    assert str(lazy.records[i])==str(eager.records[i])
+
+# closing the EMF releases the mapped file; records already read stay
+# usable, but the rest can't be read any more
+with pyemf.EMF() as lazy:
+    lazy.load("test-lazyload.emf",lazy=True)
+    first=lazy.records[3]
+assert str(first)==str(eager.records[3])
+assert first.pack()==eager.records[3].pack()
+try:
+    lazy.records[4]
+    raise AssertionError("record read after close")
+except ValueError:
+    pass
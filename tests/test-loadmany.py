@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# Test of loading many files in worker processes with load_many: every
+# file must be loaded as it would be on its own
+
+from operator import methodcaller
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def draw(count):
+    emf=pyemf.EMF(width,height,dpi)
+    pen=emf.CreatePen(pyemf.PS_SOLID,count,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,100+100*count,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+    emf.Polyline([(100,100),(1000,1500),(2000,count)])
+    emf.TextOut(100,1700,"file %d" % count)
+    return emf
+
+ret=draw(20).save("test-loadmany.emf")
+print("save returns %s" % str(ret))
+filenames=["test-loadmany.emf"]
+for count in range(1,8):
+    filenames.append("test-loadmany-%d.emf" % count)
+    draw(count).save(filenames[-1])
+
+results=dict(pyemf.load_many(filenames,workers=2))
+assert sorted(results)==sorted(filenames)
+for filename in filenames:
+    emf=results[filename]
+    assert emf.tobytes()==open(filename,"rb").read()
+    assert len(emf.dc.objects)==2
+
+# the result can be made in the workers instead of sending back the
+# records, and a file that can't be loaded gives its exception
+results=dict(pyemf.load_many(filenames+["test-loadmany-missing.emf"],workers=3,reduce=methodcaller("tobytes")))
+for filename in filenames:
+    assert results[filename]==open(filename,"rb").read()
+assert isinstance(results["test-loadmany-missing.emf"],OSError)
+
+# only the records of the given types are decoded
+for filename,emf in pyemf.load_many(filenames[:2],workers=2,decode={emr.LINETO.emr_id}):
+    assert emf.tobytes()==open(filename,"rb").read()
+    assert isinstance(emf.records[-2],emr.RAW)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+# Test of NumPy point arrays: they must give the same records as lists
+# of points, and float arrays must be refused like floats in a list
+
+import struct
+import sys
+
+# importing pyemf mustn't import NumPy
+numpyloaded='numpy' in sys.modules
+import pyemf
+assert ('numpy' in sys.modules)==numpyloaded
+
+width=8
+height=6
+dpi=300
+
+def draw(points,bigpoints,polylist):
+    emf=pyemf.EMF(width,height,dpi)
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    emf.Polyline(points)
+    emf.Polygon(bigpoints)
+    emf.PolyPolyline(polylist)
+    return emf
+
+points=[(100,100),(1000,1500),(2000,100)]
+bigpoints=[(100,100),(100000,1500),(2000,100)]
+polylist=[[(100,y),(1000,y+100),(2000,y)] for y in range(200,1500,200)]
+
+emf=draw(points,bigpoints,polylist)
+ret=emf.save("test-numpy.emf")
+print("save returns %s" % str(ret))
+
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+if numpy is not None:
+    arrays=draw(numpy.array(points),numpy.array(bigpoints,dtype=numpy.int64),
+                [numpy.array(polygon,dtype=numpy.int16) for polygon in polylist])
+    assert arrays.tobytes()==open("test-numpy.emf","rb").read()
+
+    # floats aren't silently truncated
+    try:
+        pyemf.EMF(width,height,dpi).Polyline(numpy.array([[1.7,2.2],[3.9,4.5]]))
+        assert False
+    except TypeError:
+        pass
+    floats=pyemf.EMF(width,height,dpi)
+    floats.Polyline(numpy.array(points))
+    floats.records[-1].aptl=numpy.array([[1.7,2.2],[3.9,4.5]])
+    try:
+        floats.tobytes()
+        assert False
+    except struct.error:
+        pass
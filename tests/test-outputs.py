@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Test of tobytes, serialize_into, iter_chunks and saving more than
+# once: none of them may change the records, so drawing can go on
+# afterwards and the EOF record stays at the end
+
+import gzip
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def drawStart(emf):
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,1000,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+
+def drawEnd(emf):
+    emf.Polyline([(100,100),(1000,1500),(2000,100)])
+    emf.LineTo(50,50)
+
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+drawEnd(emf)
+ret=emf.save("test-outputs.emf")
+print("save returns %s" % str(ret))
+expected=open("test-outputs.emf","rb").read()
+
+def check(data):
+    assert bytes(data)==expected
+    loaded=pyemf.EMF()
+    loaded.loadmem(bytes(data))
+    eofs=[i for i in range(len(loaded.records)) if isinstance(loaded.records[i],emr.EOF)]
+    assert eofs==[len(loaded.records)-1]
+
+# output in between drawing
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+count=len(emf.records)
+emf.tobytes()
+buf=bytearray(100000)
+emf.serialize_into(buf)
+b''.join(emf.iter_chunks(64))
+assert len(emf.records)==count
+drawEnd(emf)
+check(emf.tobytes())
+size=emf.serialize_into(buf,10)
+check(buf[10:10+size])
+check(b''.join(emf.iter_chunks(64)))
+
+# saving to an EMZ file, drawing and saving again
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-outputs.emz")
+drawEnd(emf)
+emf.save("test-outputs.emz")
+check(gzip.decompress(open("test-outputs.emz","rb").read()))
+
+# saving, drawing and saving again
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-outputs-twice.emf")
+drawEnd(emf)
+emf.save("test-outputs-twice.emf")
+check(open("test-outputs-twice.emf","rb").read())
+
+# drawing after loading a file moves its EOF to the end
+emf=pyemf.EMF(width,height,dpi)
+drawStart(emf)
+emf.save("test-outputs-start.emf")
+for lazy in (False,True):
+    loaded=pyemf.EMF()
+    loaded.load("test-outputs-start.emf",lazy=lazy)
+    drawEnd(loaded)
+    check(loaded.tobytes())
+
+# a stream writer can't return the whole file
+stream=pyemf.EMFStreamWriter("test-outputs-stream.emf",width,height,dpi)
+drawStart(stream)
+try:
+    stream.tobytes()
+    assert False
+except ValueError:
+    pass
+stream.close()
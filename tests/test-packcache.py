@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Test of the packed bytes kept by each record: a record is only packed
+# again after one of its fields is changed, and the bytes of a loaded
+# record are written back out as they are
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def draw(color,y):
+    emf=pyemf.EMF(width,height,dpi)
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,color)
+    emf.SelectObject(pen)
+    for x in range(100,2000,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,y)
+    emf.TextOut(100,1700,"cached")
+    return emf
+
+emf=draw((0x01,0xa0,0xff),1500)
+ret=emf.save("test-packcache.emf")
+print("save returns %s" % str(ret))
+
+# saving again packs nothing, and gives the same file
+packed=[e.pack() for e in emf.records]
+for e in emf.records:
+    assert not e.isModified()
+    assert e.pack() is e.data
+assert emf.tobytes()==open("test-packcache.emf","rb").read()
+assert all(e.pack() is data for e,data in zip(emf.records,packed))
+
+# a loaded record keeps the bytes it was loaded from
+loaded=pyemf.EMF()
+loaded.load("test-packcache.emf")
+data=open("test-packcache.emf","rb").read()
+ptr=0
+for e in loaded.records:
+    assert not e.isModified()
+    assert bytes(e.pack())==data[ptr:ptr+e.nSize]
+    ptr+=e.nSize
+
+# assigning the value a field already has changes nothing
+lines=[e for e in loaded.records if isinstance(e,emr.LINETO)]
+before=lines[0].pack()
+lines[0].ptl_x=lines[0].ptl_x
+lines[0].values["ptl_y"]=lines[0].ptl_y
+assert not lines[0].isModified()
+assert lines[0].pack() is before
+
+# assigning a different value, either as an attribute or through
+# values, makes the record pack itself again, once
+for e in lines:
+    e.ptl_y=1200
+pen=[e for e in loaded.records if isinstance(e,emr.CREATEPEN)][0]
+pen.values["lopn_color"]=pyemf.RGB(0x80,0x40,0x20)
+assert all(e.isModified() for e in lines+[pen])
+packed=lines[0].pack()
+assert not lines[0].isModified()
+assert lines[0].pack() is packed
+others=[e for e in loaded.records if e not in lines and e is not pen]
+before=[e.data for e in others]
+assert loaded.tobytes()==draw((0x80,0x40,0x20),1200).tobytes()
+assert all(e.data is data for e,data in zip(others,before))
+
+# a list field that is replaced is seen, a list changed in place isn't
+# until the record is marked as modified
+text=[e for e in loaded.records if isinstance(e,emr.EXTTEXTOUTA)][0]
+text.dx=[20]*len(text.string)
+assert text.isModified()
+before=text.pack()
+text.dx[0]=30
+assert text.pack() is before
+text.setModified()
+assert text.pack()!=before
+assert emr.fromBuffer(text.pack()).dx[0]==30
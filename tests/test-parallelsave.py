@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# Test of saving with worker processes: the file must be the same as
+# one saved by a single process, including when a record doesn't pack
+# to the size it was expected to have
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def draw():
+    emf=pyemf.EMF(width,height,dpi)
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for i in range(5000):
+        emf.LineTo(i%2000,i%1500)
+        if i%100==0:
+            emf.Polyline([(i,100),(1000,i),(100000,100)])
+            emf.TextOut(100,i,"parallel %d" % i)
+    return emf
+
+emf=draw()
+ret=emf.save("test-parallelsave.emf")
+print("save returns %s" % str(ret))
+expected=open("test-parallelsave.emf","rb").read()
+
+emf=draw()
+emf.save("test-parallelsave-workers.emf",workers=2)
+assert open("test-parallelsave-workers.emf","rb").read()==expected
+# and again, now that the records have been sized
+emf.save("test-parallelsave-workers.emf",workers=3)
+assert open("test-parallelsave-workers.emf","rb").read()==expected
+
+# records of a lazy load that haven't been touched are copied from the
+# map, including when saving over the mapped file itself
+loaded=pyemf.EMF()
+loaded.load("test-parallelsave-workers.emf",lazy=True)
+loaded.records[10].ptl_x+=1
+loaded.records[10].ptl_x-=1
+loaded.save("test-parallelsave-workers.emf",workers=2)
+assert open("test-parallelsave-workers.emf","rb").read()==expected
+
+# a record that packs to a different size than calcSize says makes
+# the workers give up, and the file is written serially instead
+class WrongSize(emr.LINETO):
+    def calcSize(self):
+        return emr.LINETO.calcSize(self)+4
+
+reference=draw()
+emf=draw()
+emf.records.append(WrongSize(7,8))
+reference.records.append(emr.LINETO(7,8))
+emf.save("test-parallelsave-wrongsize.emf",workers=2)
+assert open("test-parallelsave-wrongsize.emf","rb").read()==reference.tobytes()
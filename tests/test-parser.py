@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Test of EMFParser: feeding a file in small pieces, compressed or not,
+# must give the same records as loading it
+
+import gzip
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,2000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+font=emf.CreateFont(50,name="Arial")
+emf.SelectObject(font)
+emf.TextOut(100,1700,"parser")
+emf.DeleteObject(pen)
+
+ret=emf.save("test-parser.emf")
+print("save returns %s" % str(ret))
+
+data=open("test-parser.emf","rb").read()
+loaded=pyemf.EMF()
+loaded.load("test-parser.emf")
+expected=[e.pack() for e in loaded.records]
+
+def parse(data,chunksize):
+    parser=pyemf.EMFParser()
+    records=[]
+    for i in range(0,len(data),chunksize):
+        parser.feed(data[i:i+chunksize])
+        records.extend(parser)
+    parser.close()
+    records.extend(parser)
+    assert len(parser.dc.objects)==len(loaded.dc.objects)
+    return [e.pack() for e in records]
+
+compressed=gzip.compress(data)
+for chunksize in (1,3,7,64,len(data)):
+    assert parse(data,chunksize)==expected
+    assert parse(compressed,chunksize)==expected
+
+# an EMZ made of several gzip members
+members=gzip.compress(data[:100])+gzip.compress(data[100:])
+assert parse(members,5)==expected
+
+# records are also passed to a callback as they are completed
+received=[]
+parser=pyemf.EMFParser(callback=received.append)
+for i in range(0,len(compressed),11):
+    parser.feed(compressed[i:i+11])
+parser.close()
+assert [e.pack() for e in received]==expected
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+# Test of probe: reading just the header of a file must give the same
+# header as loading the whole file
+
+import gzip
+import io
+import os
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi,description="probed\0image\0\0")
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,2000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+
+ret=emf.save("test-probe.emf")
+print("save returns %s" % str(ret))
+
+loaded=pyemf.EMF()
+loaded.load("test-probe.emf")
+expected=loaded.records[0].pack()
+
+header=pyemf.probe("test-probe.emf")
+assert isinstance(header,emr.HEADER)
+assert header.pack()==expected
+assert header.nBytes==os.path.getsize("test-probe.emf")
+assert header.nRecords==len(loaded.records)
+assert header.nHandles==len(loaded.dc.objects)
+assert header.rclBounds==loaded.records[0].rclBounds
+assert header.description==loaded.records[0].description
+
+# from a file object, which is left open after the header
+fh=open("test-probe.emf","rb")
+assert pyemf.probe(fh).pack()==expected
+assert fh.tell()==len(expected)
+fh.close()
+
+# from an EMZ file
+with gzip.GzipFile("test-probe.emz","wb",mtime=0) as out:
+    out.write(open("test-probe.emf","rb").read())
+assert pyemf.probe("test-probe.emz").pack()==expected
+
+# anything that doesn't start with a header isn't an EMF file
+for data in (b"",b"\0"*4,open("test-probe.emf","rb").read()[len(expected):]):
+    try:
+        pyemf.probe(io.BytesIO(data))
+        raise AssertionError("probe accepted %r" % data[:8])
+    except ValueError:
+        pass
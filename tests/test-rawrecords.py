@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Test of loading with a decode filter: records that aren't decoded are
+# kept as RAW records, which must still save correctly after being
+# marked as modified or edited
+
+import struct
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,1000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.DeleteObject(pen)
+
+ret=emf.save("test-rawrecords.emf")
+print("save returns %s" % str(ret))
+original=open("test-rawrecords.emf","rb").read()
+
+raw=pyemf.EMF()
+raw.load("test-rawrecords.emf",decode={emr.POLYLINE16.emr_id})
+rawrecords=[e for e in raw.records if isinstance(e,emr.RAW)]
+assert len(rawrecords)>0
+assert isinstance(raw.records[-3],emr.POLYLINE16)
+
+# marking RAW records as modified mustn't lose their bytes
+for e in rawrecords:
+    e.setModified()
+assert raw.tobytes()==original
+
+# edit the first LINETO through its raw bytes
+lineto=[i for i in range(len(raw.records)) if raw.records[i].iType==emr.LINETO.emr_id][0]
+raw.records[lineto].body=struct.pack("<ii",123,456)
+raw.save("test-rawrecords-edited.emf")
+
+edited=pyemf.EMF()
+edited.load("test-rawrecords-edited.emf")
+full=pyemf.EMF()
+full.load("test-rawrecords.emf")
+assert len(edited.records)==len(full.records)
+assert edited.records[0].nBytes==len(original)
+for i in range(len(full.records)):
+    if i==lineto:
+        assert (edited.records[i].ptl_x,edited.records[i].ptl_y)==(123,456)
+    elif i>0:
+        assert edited.records[i].pack()==full.records[i].pack()
+
+# changing the type of a RAW record rewrites its prefix
+raw.records[lineto].iType=emr.MOVETOEX.emr_id
+assert isinstance(raw.records[lineto].decode(),emr.MOVETOEX)
+assert raw.records[lineto].decode().ptl_x==123
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+# Test of the record index: records read one at a time through the
+# index must be the same as those of an ordinary load
+
+import gzip
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+for x in range(100,2000,100):
+    emf.MoveTo(x,100)
+    emf.LineTo(x,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.TextOut(100,1700,"indexed")
+emf.DeleteObject(pen)
+ret=emf.save("test-recordindex.emf")
+print("save returns %s" % str(ret))
+
+loaded=pyemf.EMF()
+loaded.load("test-recordindex.emf")
+lines=[i for i in range(len(loaded.records)) if loaded.records[i].iType==emr.LINETO.emr_id]
+
+with pyemf.build_index("test-recordindex.emf") as index:
+    assert len(index)==len(loaded.records)
+    for i in (len(index)-1,0,3,len(index)-2):
+        assert index.get_record(i).pack()==loaded.records[i].pack()
+    assert index.indices_of_type(emr.LINETO.emr_id)==lines
+    found=list(index.records_of_type(emr.LINETO.emr_id))
+    assert [e.pack() for e in found]==[loaded.records[i].pack() for i in lines]
+    assert index.countTypes()[emr.LINETO.emr_id]==len(lines)
+    assert list(index.records_of_type(emr.ARC.emr_id))==[]
+assert index.fh is None
+
+# an index built from a file object leaves it open for its owner
+fh=open("test-recordindex.emf","rb")
+with pyemf.build_index(fh) as index:
+    assert index.get_record(3).pack()==loaded.records[3].pack()
+assert not fh.closed
+fh.seek(0)
+assert fh.read(8)==loaded.records[0].pack()[:8]
+fh.close()
+
+# records of an EMZ file are indexed by their offsets in the
+# decompressed data
+with gzip.GzipFile("test-recordindex.emz","wb",mtime=0) as out:
+    out.write(open("test-recordindex.emf","rb").read())
+with pyemf.build_index("test-recordindex.emz") as index:
+    assert len(index)==len(loaded.records)
+    assert index.get_record(lines[-1]).pack()==loaded.records[lines[-1]].pack()
+    assert index.get_record(3).pack()==loaded.records[3].pack()
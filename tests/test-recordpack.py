@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Test of packing records: the precompiled pack path must give the same
+# bytes, offsets and counts as packing every field on its own, also
+# after variable length fields change size
+
+import contextlib
+import io
+import struct
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi,description="packed")
+pen=emf.CreatePen(pyemf.PS_DASH,3,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+emf.SetWorldTransform(1.5,0.25,-0.25,1.5,10.0,-20.5)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.Polyline([(100,100),(100000,1500)])
+emf.PolyPolygon([[(0,0),(100,0),(100,100)],[(200,200),(300,200),(300,300),(200,300)]])
+emf.Rectangle(10,10,500,400)
+emf.BeginPath()
+emf.MoveTo(500,500)
+emf.PolylineTo([(2500,500),(500,500)])
+emf.EndPath()
+emf.StrokePath()
+font=emf.CreateFont(-50,0,450,450,pyemf.FW_BOLD,1,0,0,name="Arial")
+emf.SelectObject(font)
+emf.TextOut(100,1700,"packed")
+emf.TextOut(100,1800,"")
+
+ret=emf.save("test-recordpack.emf")
+print("save returns %s" % str(ret))
+
+def check(e):
+    # pack each field on its own, as records used to be packed
+    expected=e.format.packFields(e.values,e,8)
+    assert e.format.packCompiled(e,8)==expected,e
+    return expected
+
+for e in emf.records:
+    check(e)
+
+loaded=pyemf.EMF()
+loaded.load("test-recordpack.emf")
+data=open("test-recordpack.emf","rb").read()
+ptr=0
+for e in loaded.records:
+    packed=check(e)
+    assert data[ptr+8:ptr+8+len(packed)]==packed
+    assert e.nSize==8+len(packed)+e.sizeExtra()
+    ptr+=e.nSize
+
+# variable length fields that grow and shrink move the fields after
+# them, and change the counts and offsets that refer to them
+text=[e for e in loaded.records if isinstance(e,emr.EXTTEXTOUTA)]
+text[0].string="a longer string than before"
+text[1].string="x"
+text[0].dx=[10]*len(text[0].string)
+text[1].dx=[5]
+polys=[e for e in loaded.records if isinstance(e,emr.POLYPOLYGON16)]
+polys[0].aPolyCounts=[3,3,2]
+polys[0].aptl=[[1,2],[3,4],[5,6],[7,8],[9,10],[11,12],[13,14],[15,16]]
+loaded.records[0].description="a longer description"
+for e in text+polys+[loaded.records[0]]:
+    packed=check(e)
+    assert e.pack()[8:8+len(packed)]==packed
+    assert e.nSize==8+len(packed)+e.sizeExtra()
+assert text[0].nChars==len("a longer string than before")
+assert text[0].offString==text[0].offDx+4*text[0].nChars
+assert polys[0].nPolys==3 and polys[0].cptl==8
+
+emf=pyemf.EMF()
+emf.loadmem(loaded.tobytes())
+assert emf.records[0].description==loaded.records[0].description
+assert [e.string for e in emf.records if isinstance(e,emr.EXTTEXTOUTA)]==["a longer string than before","x"]
+assert [e for e in emf.records if isinstance(e,emr.POLYPOLYGON16)][0].aptl==polys[0].aptl
+
+# a value that can't be packed still raises the struct error
+e=emr.LINETO(1,2)
+e.ptl_x="one"
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        e.pack()
+        raise AssertionError("packed a string as an integer")
+    except struct.error:
+        pass
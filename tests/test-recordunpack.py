@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# Test of decoding records: the leading fixed size fields of a record
+# are decoded together with one precompiled struct, which must give the
+# same values as decoding every field on its own
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi)
+pen=emf.CreatePen(pyemf.PS_DASH,3,(0x01,0xa0,0xff))
+brush=emf.CreateHatchBrush(pyemf.HS_CROSS,(0xff,0,0))
+emf.SelectObject(pen)
+emf.SelectObject(brush)
+emf.SetBkMode(pyemf.TRANSPARENT)
+emf.SetPolyFillMode(pyemf.WINDING)
+emf.SetWorldTransform(1.5,0.25,-0.25,1.5,10.0,-20.5)
+emf.SetPixel(10,20,(1,2,3))
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.Polyline([(100,100),(100000,1500)])
+emf.PolyPolygon([[(0,0),(100,0),(100,100)],[(200,200),(300,200),(300,300),(200,300)]])
+emf.PolyPolyline([[(5,5),(50,50)],[(7,7),(70,0),(700,7)]])
+emf.Rectangle(10,10,500,400)
+emf.Chord(0,0,800,600,800,300,0,300)
+emf.PolyBezier([(0,0),(10,100),(200,-100),(300,0)])
+emf.BeginPath()
+emf.MoveTo(500,500)
+emf.ArcTo(400,400,600,600,600,500,400,500)
+emf.PolylineTo([(2500,500),(500,500)])
+emf.CloseFigure()
+emf.EndPath()
+emf.StrokeAndFillPath()
+emf.SaveDC()
+emf.SetTextAlign(pyemf.TA_BASELINE)
+emf.SetTextColor((0,0x80,0))
+font=emf.CreateFont(-50,0,450,450,pyemf.FW_BOLD,1,0,0,name="Arial")
+emf.SelectObject(font)
+emf.TextOut(100,1700,"decoded")
+emf.TextOut(100,1800,"")
+emf.RestoreDC(-1)
+emf.DeleteObject(font)
+emf.DeleteObject(pen)
+
+ret=emf.save("test-recordunpack.emf")
+print("save returns %s" % str(ret))
+
+loaded=pyemf.EMF()
+loaded.load("test-recordunpack.emf")
+assert len(loaded.records)==loaded.records[0].nRecords
+for e in loaded.records:
+    data=e.pack()
+    # decode each field in turn, as the record used to be decoded
+    reference=type(e)()
+    ptr=8
+    for name in e.format.names:
+        (value,size)=e.format.fmtmap[name].unpack(reference,name,data,ptr)
+        setattr(reference,name,value)
+        ptr+=size
+    for name in e.format.names:
+        assert getattr(e,name)==getattr(reference,name),(e,name)
+    assert not e.isModified()
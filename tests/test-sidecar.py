@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Test of sidecar index files: an index written next to an EMF file is
+# reused while the file is unchanged, and ignored once it changes
+
+import io
+import os
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+def draw(count):
+    emf=pyemf.EMF(width,height,dpi)
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,100+100*count,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+    emf.Polyline([(100,100),(1000,1500),(2000,100)])
+    emf.DeleteObject(pen)
+    return emf
+
+emf=draw(20)
+ret=emf.save("test-sidecar.emf")
+print("save returns %s" % str(ret))
+if os.path.exists("test-sidecar.emf.idx"):
+    os.remove("test-sidecar.emf.idx")
+
+index=pyemf.build_index("test-sidecar.emf",sidecar=True)
+count=len(index)
+index.close()
+assert os.path.exists("test-sidecar.emf.idx")
+
+# the sidecar is read instead of scanning the file, so the file hasn't
+# been opened
+index=pyemf.build_index("test-sidecar.emf")
+assert index.fh is None
+assert len(index)==count
+assert index.types[-1]==emr.EOF.emr_id
+assert str(index.get_record(3))==str(emf.records[3])
+index.close()
+
+lazy=pyemf.EMF()
+lazy.load("test-sidecar.emf",lazy=True)
+assert len(lazy.records)==count
+
+# once the file changes, the sidecar is out of date and the file is
+# scanned again
+draw(20).save("test-sidecar-changed.emf")
+pyemf.build_index("test-sidecar-changed.emf",sidecar=True).close()
+draw(30).save("test-sidecar-changed.emf")
+index=pyemf.build_index("test-sidecar-changed.emf")
+assert index.fh is not None
+assert len(index)==count+20
+index.close()
+lazy=pyemf.EMF()
+lazy.load("test-sidecar-changed.emf",lazy=True)
+assert len(lazy.records)==count+20
+assert lazy.records[-1].iType==emr.EOF.emr_id
+parallel=pyemf.EMF()
+parallel.load("test-sidecar-changed.emf",workers=2)
+assert len(parallel.records)==count+20
+
+# and is replaced when asked for
+pyemf.build_index("test-sidecar-changed.emf",sidecar=True).close()
+index=pyemf.build_index("test-sidecar-changed.emf")
+assert index.fh is None
+assert len(index)==count+20
+
+# a file object has no name to put a sidecar next to
+try:
+    pyemf.build_index(io.BytesIO(open("test-sidecar-changed.emf","rb").read()),sidecar=True)
+    raise AssertionError("sidecar written for a file object")
+except ValueError:
+    pass
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Test of the fields of records, which are kept in slots generated from
+# the typedef of each record class and are still available through the
+# dict-like values of the record
+
+import copy
+import pickle
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+
+emf=pyemf.EMF(width,height,dpi,description="slots")
+pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+emf.SelectObject(pen)
+emf.MoveTo(100,100)
+emf.LineTo(2000,1500)
+emf.Polyline([(100,100),(1000,1500),(2000,100)])
+emf.PolyPolygon([[(0,0),(100,0),(100,100)],[(200,200),(300,200),(300,300),(200,300)]])
+emf.TextOut(100,1700,"slots")
+
+ret=emf.save("test-slots.emf")
+print("save returns %s" % str(ret))
+
+loaded=pyemf.EMF()
+loaded.load("test-slots.emf")
+for e in list(emf.records)+list(loaded.records):
+    # every field is a property of the class, and is kept in a slot
+    # rather than in the instance dict
+    names=list(e.format.names)
+    assert list(e.values)==names
+    assert len(e.values)==len(names)
+    for name in names:
+        assert isinstance(getattr(type(e),name),property),(e,name)
+        assert e.values[name]==getattr(e,name)
+    assert not set(vars(e))&set(names+["values","iType","nSize"]),e
+
+    # records are pickled and copied with all their fields
+    for other in (pickle.loads(pickle.dumps(e)),copy.copy(e),copy.deepcopy(e)):
+        assert type(other) is type(e)
+        assert bytes(other.pack())==bytes(e.pack())
+        for name in names:
+            assert other.values[name]==e.values[name]
+
+# fields can be read and assigned through values
+line=[e for e in loaded.records if isinstance(e,emr.LINETO)][0]
+line.values["ptl_x"]=500
+assert line.ptl_x==500 and line.isModified()
+line.values={"ptl_x":600,"ptl_y":700}
+assert (line.ptl_x,line.ptl_y)==(600,700)
+assert dict(line.values)=={"ptl_x":600,"ptl_y":700}
+assert "ptl_x" in line.values and "aptl" not in line.values
+try:
+    line.values["aptl"]
+    raise AssertionError("read a field the record doesn't have")
+except KeyError:
+    pass
+try:
+    del line.values["ptl_x"]
+    raise AssertionError("deleted a field")
+except TypeError:
+    pass
+try:
+    line.aptl
+    raise AssertionError("read a field the record doesn't have")
+except AttributeError:
+    pass
+
+# a subclass shares the slots of the fields it inherits, and gets new
+# slots for the fields its own typedef adds
+assert "string" not in vars(emr.EXTTEXTOUTW) and "_string" not in emr.EXTTEXTOUTW.__slots__
+class LINETOZ(emr.LINETO):
+    typedef=emr.LINETO.typedef+[('i','ptl_z',0)]
+e=LINETOZ()
+e.ptl_x=1
+e.ptl_z=3
+assert "_ptl_x" in emr.MOVETOEX.__slots__ and "_ptl_z" in LINETOZ.__slots__
+assert "_ptl_x" not in LINETOZ.__slots__
+assert list(e.values)==["ptl_x","ptl_y","ptl_z"]
+assert not vars(e)
+assert bytes(e.pack())[8:]==b"\x01\0\0\0\0\0\0\0\x03\0\0\0"
+
+# a field can't be hidden by a class attribute of the same name
+try:
+    class BADLINETO(emr.LINETO):
+        ptl_x=0
+    raise AssertionError("made a class attribute of a field")
+except TypeError:
+    pass
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# Test of keeping the records under a memory limit: spilled records
+# must be read back with any changes made to them, and the file must be
+# the same as one saved without a limit
+
+import pickle
+
+import pyemf
+from pyemf import emr
+
+width=8
+height=6
+dpi=300
+limit=1000
+
+def draw(emf):
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,2000,10):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+    emf.Polyline([(100,100),(1000,1500),(2000,100)])
+    emf.TextOut(100,200,"spilled")
+    emf.DeleteObject(pen)
+    return emf
+
+emf=draw(pyemf.EMF(width,height,dpi))
+ret=emf.save("test-spill.emf")
+print("save returns %s" % str(ret))
+expected=open("test-spill.emf","rb").read()
+
+spilled=draw(pyemf.EMF(width,height,dpi,memory_limit=limit))
+count=len(spilled.records)
+assert count==len(emf.records)
+assert spilled.records.isSpilled(3)
+assert not spilled.records.isSpilled(0)
+assert not spilled.records.isSpilled(count-1)
+spilled.save("test-spill-drawn.emf")
+assert open("test-spill-drawn.emf","rb").read()==expected
+assert spilled.tobytes()==expected
+assert b"".join(spilled.iter_chunks(100))==expected
+
+# a spilled record is read back when accessed, and a change to it is
+# kept when it is spilled again
+loaded=pyemf.EMF(memory_limit=limit)
+loaded.load("test-spill.emf")
+assert len(loaded.records)==count+1
+assert loaded.records.isSpilled(3)
+assert str(loaded.records[3])==str(emf.records[3])
+loaded.records[3].ptl_x=150
+loaded.records[4].ptl_y+=7
+for i in range(len(loaded.records)):
+    loaded.records[i]
+assert loaded.records.isSpilled(3)
+assert loaded.records[3].ptl_x==150
+assert loaded.records[4].ptl_y==1507
+
+# the limit also applies to records decoded by worker processes
+parallel=pyemf.EMF(memory_limit=limit)
+parallel.load("test-spill.emf",workers=2)
+assert len(parallel.records)==count+1
+assert parallel.records.isSpilled(3)
+parallel.save("test-spill-parallel.emf")
+assert open("test-spill-parallel.emf","rb").read()==expected
+
+# replacing a spilled record
+assert loaded.records.isSpilled(10)
+loaded.records[10]=emr.LINETO(42,43)
+assert not loaded.records.isSpilled(10)
+assert loaded.records[-1].emr_id==emr.EOF.emr_id
+
+emf.records[3].ptl_x=150
+emf.records[4].ptl_y+=7
+emf.records[10]=emr.LINETO(42,43)
+loaded.save("test-spill-edited.emf")
+assert open("test-spill-edited.emf","rb").read()==emf.tobytes()
+assert b"".join(loaded.iter_chunks(100))==emf.tobytes()
+
+# records taken out of a spilled list can be pickled
+for i in (3,10,count-2):
+    record=pickle.loads(pickle.dumps(loaded.records[i]))
+    assert str(record)==str(emf.records[i])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# Test of EMFStreamWriter: records written as they are drawn must give
+# the same file as an ordinary EMF, whether the output can seek or not
+
+import gzip
+import io
+
+import pyemf
+
+width=8
+height=6
+dpi=300
+
+def draw(emf):
+    pen=emf.CreatePen(pyemf.PS_SOLID,10,(0x01,0xa0,0xff))
+    emf.SelectObject(pen)
+    for x in range(100,2000,100):
+        emf.MoveTo(x,100)
+        emf.LineTo(x,1500)
+    emf.BeginPath()
+    emf.MoveTo(500,500)
+    emf.LineTo(1500,2000)
+    emf.PolylineTo([(2500,500),(500,500)])
+    emf.CloseFigure()
+    emf.EndPath()
+    emf.StrokeAndFillPath()
+    font=emf.CreateFont(50,name="Arial")
+    emf.SelectObject(font)
+    emf.TextOut(100,1700,"streamed")
+    emf.DeleteObject(pen)
+    emf.DeleteObject(font)
+
+emf=pyemf.EMF(width,height,dpi)
+draw(emf)
+ret=emf.save("test-streamwriter.emf")
+print("save returns %s" % str(ret))
+expected=open("test-streamwriter.emf","rb").read()
+
+# to a file
+with pyemf.EMFStreamWriter("test-streamwriter-stream.emf",width,height,dpi) as stream:
+    draw(stream)
+    # only the records not yet written are kept
+    assert len(stream.records)<=1
+assert open("test-streamwriter-stream.emf","rb").read()==expected
+
+# to an output that can't seek, like a pipe, so the records are spooled
+# and copied after the header on close
+class Pipe:
+    def __init__(self):
+        self.data=io.BytesIO()
+    def write(self,data):
+        return self.data.write(data)
+    def flush(self):
+        pass
+    def seekable(self):
+        return False
+
+pipe=Pipe()
+stream=pyemf.EMFStreamWriter(pipe,width,height,dpi)
+draw(stream)
+stream.close()
+assert pipe.data.getvalue()==expected
+
+# to a compressed EMZ file
+with pyemf.EMFStreamWriter("test-streamwriter.emz",width,height,dpi) as stream:
+    draw(stream)
+assert gzip.decompress(open("test-streamwriter.emz","rb").read())==expected
+
+# the result loads like any other file
+loaded=pyemf.EMF()
+loaded.load("test-streamwriter.emz")
+assert loaded.records[0].nRecords==len(loaded.records)
+assert loaded.records[0].nBytes==len(expected)
+
+# a path that is ended but never used doesn't make the writer hold on
+# to the records that follow it, and the bounds of later paths are
+# still the same as those worked out by an ordinary EMF
+def drawPaths(emf):
+    emf.BeginPath()
+    emf.MoveTo(10,10)
+    emf.LineTo(20,30)
+    emf.EndPath()
+    for i in range(1000):
+        emf.LineTo(i,i%300)
+        assert not isinstance(emf,pyemf.EMFStreamWriter) or len(emf.records)<=1
+    emf.BeginPath()
+    emf.MoveTo(500,500)
+    emf.PolylineTo([(2500,700),(900,1500)])
+    emf.EndPath()
+    emf.LineTo(3000,3000)
+    emf.StrokePath()
+    emf.Polyline([(5,6),(7,8)])
+    emf.FillPath()
+
+emf=pyemf.EMF(width,height,dpi)
+drawPaths(emf)
+with pyemf.EMFStreamWriter("test-streamwriter-paths.emf",width,height,dpi) as stream:
+    drawPaths(stream)
+    assert len(stream.records)<=1
+assert open("test-streamwriter-paths.emf","rb").read()==emf.tobytes()